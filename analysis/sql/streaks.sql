@@ -1,7 +1,8 @@
+-- players by white_id/black_id (clean.py players dimension): window partitions hash and sort ints, not usernames
 WITH stacked AS (
-  SELECT game_id, game_datetime, white AS player, 'white' AS role, result, game_type FROM games
+  SELECT game_id, game_datetime, white_id AS player, 'white' AS role, result, game_type FROM games
   UNION ALL
-  SELECT game_id, game_datetime, black AS player, 'black' AS role, result, game_type FROM games
+  SELECT game_id, game_datetime, black_id AS player, 'black' AS role, result, game_type FROM games
 ),
 
 ordered AS (
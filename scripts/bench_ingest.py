@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# bench_ingest.py
+"""
+Benchmark extract_all.stream_to_parquet on synthetic corpora (see gen_corpus.py).
+
+For every size in --sizes a corpus is generated once (cached in --corpus-dir by size and seed)
+and every --variant is run over it in a fresh process, so peak RSS is per run. Reported per run:
+games/s, decompressed MB/s, wall seconds, peak RSS and the stage seconds from IngestMetrics.
+Results are printed as a table and, with --json, appended as JSON lines tagged with the git
+commit so runs can be compared from commit to commit.
+
+Usage example:
+python scripts\\bench_ingest.py --sizes 1000,10000,50000 --json out/bench/results.jsonl
+
+A variant is "label:key=value,..." with stream_to_parquet keyword arguments, e.g.
+  --variant "fast:fast_scan=true" --variant "fast-w4:fast_scan=true,workers=4"
+Defaults: full (chess.pgn replay) and fast (fast_scan=true).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from gen_corpus import DEFAULT_SEED, write_corpus
+
+DEFAULT_SIZES = "1000,10000"
+DEFAULT_VARIANTS = ("full:", "fast:fast_scan=true")
+DEFAULT_CORPUS_DIR = "out/bench"
+
+logger = logging.getLogger(__name__)
+
+
+def parse_variant(spec: str) -> tuple[str, dict]:
+    """ "fast:fast_scan=true,workers=4" -> ("fast", {"fast_scan": True, "workers": 4})."""
+    label, _, rest = spec.partition(":")
+    kwargs = {}
+    for part in filter(None, (p.strip() for p in rest.split(","))):
+        key, sep, value = part.partition("=")
+        if not sep:
+            raise ValueError(f"variant option {part!r} in {spec!r} is not key=value")
+        low = value.strip().lower()
+        if low in ("true", "false"):
+            kwargs[key.strip()] = low == "true"
+        else:
+            try:
+                kwargs[key.strip()] = int(value)
+            except ValueError:
+                try:
+                    kwargs[key.strip()] = float(value)
+                except ValueError:
+                    kwargs[key.strip()] = value.strip()
+    return label.strip() or "default", kwargs
+
+
+def peak_rss_bytes() -> int | None:
+    """Peak RSS of this process plus its largest finished child (workers), if the platform tells us."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) * scale
+
+
+def _run_once(corpus: str, kwargs: dict, conn) -> None:
+    """Child process: one stream_to_parquet run; sends back its final metrics record and peak RSS."""
+    logging.basicConfig(level=logging.WARNING)
+    from extract_all import METRICS_NAME, stream_to_parquet
+
+    out_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        t0 = time.perf_counter()
+        stream_to_parquet(corpus, out_dir, **kwargs)
+        wall = time.perf_counter() - t0
+        with open(Path(out_dir) / METRICS_NAME, encoding="utf-8") as f:
+            final = json.loads(f.read().splitlines()[-1])
+        conn.send({"wall_s": round(wall, 3), "peak_rss_bytes": peak_rss_bytes(), "metrics": final})
+    except BaseException as exc:
+        conn.send({"error": repr(exc)})
+        raise
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        conn.close()
+
+
+def run_variant(corpus: Path, kwargs: dict) -> dict:
+    """Run one variant over corpus in a fresh (spawned) process."""
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_run_once, args=(str(corpus), kwargs, child))
+    proc.start()
+    child.close()
+    result = parent.recv()
+    proc.join()
+    if "error" in result:
+        raise RuntimeError(f"benchmark run failed on {corpus} with {kwargs}: {result['error']}")
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=Path(__file__).resolve().parent, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark extract_all ingest on synthetic corpora")
+    p.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated corpus sizes in games (default 1000,10000)")
+    p.add_argument("--seed", type=int, default=DEFAULT_SEED, help="corpus seed (default 1)")
+    p.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="where generated corpora are cached")
+    p.add_argument("--gen-workers", type=int, default=1, help="processes for generating missing corpora")
+    p.add_argument("--variant", action="append", default=None, metavar="LABEL:KEY=VALUE,...",
+                   help="stream_to_parquet settings to benchmark (repeatable; default: full and fast)")
+    p.add_argument("--repeat", type=int, default=1, help="runs per size and variant; the fastest is reported")
+    p.add_argument("--json", default=None, metavar="PATH", help="append results as JSON lines")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    variants = [parse_variant(v) for v in (args.variant or DEFAULT_VARIANTS)]
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    commit = _git_commit()
+
+    rows = []
+    for size in sizes:
+        corpus = Path(args.corpus_dir) / f"corpus_{size}_s{args.seed}.pgn.zst"
+        if not corpus.exists():
+            logger.info("Generating %s", corpus)
+            write_corpus(corpus, size, args.seed, workers=args.gen_workers)
+        for label, kwargs in variants:
+            runs = [run_variant(corpus, kwargs) for _ in range(max(1, args.repeat))]
+            best = min(runs, key=lambda r: r["wall_s"])
+            m = best["metrics"]
+            rss = best["peak_rss_bytes"]
+            row = {
+                "commit": commit,
+                "python": platform.python_version(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "games": size,
+                "seed": args.seed,
+                "variant": label,
+                "settings": kwargs,
+                "wall_s": best["wall_s"],
+                "games_per_s": m["games_per_s"],
+                "decompressed_mb_per_s": m["decompressed_mb_per_s"],
+                "peak_rss_mb": round(rss / 2**20, 1) if rss is not None else None,
+                "stage_s": m["stage_s"],
+            }
+            rows.append(row)
+            logger.info("%s x %d: %.0f games/s, peak RSS %s MB", label, size, row["games_per_s"], row["peak_rss_mb"])
+
+    print(f"{'games':>8} {'variant':<14} {'games/s':>9} {'MB/s':>7} {'wall s':>7} {'peak MB':>8}  stage seconds")
+    for r in rows:
+        stages = " ".join(f"{k}={v:.2f}" for k, v in r["stage_s"].items())
+        print(f"{r['games']:>8} {r['variant']:<14} {r['games_per_s']:>9.0f} {r['decompressed_mb_per_s']:>7.2f} "
+              f"{r['wall_s']:>7.2f} {r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-':>8}  {stages}")
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, "a", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(r) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,44 @@
+import argparse
 import duckdb
 import glob
 import os
 
-CHUNKS = glob.glob("out/raw_games/*.parquet")
+RAW_DIR = "out/raw_games"
+
+# extract_all.py chunks (part_* with --output-mode stream); not game_index.parquet, which --index writes alongside
+RAW_PATTERNS = ("chunk_*.parquet", "part_*.parquet")
+# extract_all.py's per-month partitions
+PARTITION_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]"
 
 OUT_DIR = "out/cleaned_games"
 
-os.makedirs(OUT_DIR, exist_ok=True)
+PLAYERS_FILE = "out/players.parquet"
 
-con = duckdb.connect()
 
+GAME_TYPE_SQL = """
+            CASE
+                WHEN split_part(event, ' ', 1) IN ('Blitz','Bullet','UltraBullet','Correspondence','Classical', 'Rapid')
+                    THEN split_part(event, ' ', 1)
+                ELSE split_part(event, ' ', 2)
+            END AS game_type"""
 
+MATED_SQL = """
+            CASE
+                WHEN moves_san IS NULL THEN NULL
+                WHEN RIGHT(moves_san, 1) = '#' THEN TRUE
+                ELSE FALSE
+            END AS mated"""
+
+# per-move columns from extract_all.py --extra-columns, kept as they are when present
+EXTRA_COLUMNS = ("clocks", "evals", "has_eval", "moves_bin")
 
-for i, src in enumerate(CHUNKS):
-    out_file = f"{OUT_DIR}/cleaned_chunk_{i:04d}.parquet"
-    print(f"Processing {src} -> {out_file}")
+WHERE_SQL = """
+        WHERE white_title != 'BOT'
+        AND black_title != 'BOT'
+        AND termination NOT IN ('Unterminated', 'Rules infraction', 'Abandoned')"""
 
-    sql = f"""
-    COPY (
-        SELECT
+# raw chunks from extract_all.py --schema raw: every header is a string
+RAW_SELECT = f"""
             game_id,
             CAST(replace(utc_date, '.', '-') || ' ' || utc_time AS TIMESTAMP) AS game_datetime,
             white,
@@ -35,26 +55,161 @@ for i, src in enumerate(CHUNKS):
             CAST(NULLIF(NULLIF(split_part(timecontrol, '+', 2), ''), '-') AS INT32) AS increment_seconds,
             opening,
             eco,
-            event,
-            CASE
-                WHEN split_part(event, ' ', 1) IN ('Blitz','Bullet','UltraBullet','Correspondence','Classical', 'Rapid')
-                    THEN split_part(event, ' ', 1)
-                ELSE split_part(event, ' ', 2)
-            END AS game_type,
-            moves_san,
-            CASE
-                WHEN moves_san IS NULL THEN NULL
-                WHEN RIGHT(moves_san, 1) = '#' THEN TRUE
-                ELSE FALSE
-            END AS mated
-        FROM parquet_scan('{src}')
-        WHERE white_title != 'BOT'
-        AND black_title != 'BOT'
-        AND termination NOT IN ('Unterminated', 'Rules infraction', 'Abandoned')
-    ) TO '{out_file}' (FORMAT PARQUET, COMPRESSION 'snappy');
+            event,{GAME_TYPE_SQL},
+            moves_san,{MATED_SQL}"""
+
+# chunks from extract_all.py --schema typed are already parsed; only widen the ints
+TYPED_SELECT = f"""
+            game_id,
+            game_datetime,
+            white,
+            black,
+            CAST(white_elo AS INTEGER) AS white_elo,
+            CAST(black_elo AS INTEGER) AS black_elo,
+            CAST(white_rating_diff AS INT32) AS white_rating_diff,
+            CAST(black_rating_diff AS INT32) AS black_rating_diff,
+            white_title,
+            black_title,
+            result,
+            termination,
+            initial_time_seconds,
+            increment_seconds,
+            opening,
+            eco,
+            event,{GAME_TYPE_SQL},
+            moves_san,{MATED_SQL}"""
+
+
+# players dimension: one int32 id per username, kept in PLAYERS_FILE across runs so ids never change;
+# new names get the next ids in order of first appearance
+PLAYERS_DDL = """
+    CREATE TABLE IF NOT EXISTS players (id INTEGER, name VARCHAR, first_seen TIMESTAMP, last_seen TIMESTAMP, title VARCHAR)"""
+
+PLAYERS_UPSERT_SQL = """
+    CREATE OR REPLACE TEMP TABLE seen AS
+        SELECT name, min(game_datetime) AS first_seen, max(game_datetime) AS last_seen,
+               arg_max(NULLIF(title, ''), game_datetime) AS title
+        FROM (
+            SELECT white AS name, white_title AS title, game_datetime FROM chunk
+            UNION ALL
+            SELECT black AS name, black_title AS title, game_datetime FROM chunk
+        )
+        GROUP BY name;
+
+    UPDATE players SET
+        first_seen = least(players.first_seen, seen.first_seen),
+        last_seen = greatest(players.last_seen, seen.last_seen),
+        title = CASE WHEN players.last_seen IS NULL OR seen.last_seen >= players.last_seen
+                     THEN seen.title ELSE players.title END
+    FROM seen
+    WHERE players.name = seen.name;
+
+    INSERT INTO players
+        SELECT (SELECT coalesce(max(id), 0) FROM players) + CAST(row_number() OVER (ORDER BY first_seen, name) AS INTEGER),
+               name, first_seen, last_seen, title
+        FROM seen
+        WHERE name NOT IN (SELECT name FROM players);"""
+
+# the cleaned rows of `chunk` with their player ids, in input order
+CLEANED_SQL = """
+        SELECT c.*, w.id AS white_id, b.id AS black_id
+        FROM chunk c
+        JOIN players w ON w.name = c.white
+        JOIN players b ON b.name = c.black
+        ORDER BY c.rowid"""
+
+
+def select_for(con, source):
+    """SELECT list for a raw or typed (--schema typed) source, keeping any --extra-columns."""
+    columns = {row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+    select = TYPED_SELECT if "game_datetime" in columns else RAW_SELECT
+    return select + "".join(f",\n            {name}" for name in EXTRA_COLUMNS if name in columns)
+
+
+def load_players(con, players_file=PLAYERS_FILE):
+    """Create the players table, starting from players_file if a previous run wrote it."""
+    if players_file and os.path.exists(players_file):
+        con.execute(f"CREATE TABLE players AS SELECT * FROM read_parquet('{players_file}')")
+    else:
+        con.execute(PLAYERS_DDL)
+
+
+def save_players(con, players_file=PLAYERS_FILE):
+    con.execute(f"COPY (SELECT * FROM players ORDER BY id) TO '{players_file}' (FORMAT PARQUET, COMPRESSION 'snappy')")
+    print(f"{con.execute('SELECT count(*) FROM players').fetchone()[0]} players -> {players_file}")
+
+
+def stage_chunk(con, source):
+    """Filter and normalise `source` (a table, view or parquet_scan(...)) into the temp table chunk and add its players."""
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE chunk AS
+        SELECT{select_for(con, source)}
+        FROM {source}{WHERE_SQL}
+    """)
+    con.execute(PLAYERS_UPSERT_SQL)
+
+
+def raw_chunks(raw_dir=RAW_DIR):
+    """
+    Raw chunk files in raw_dir and its YYYY-MM/ partitions (extract_all.py with several inputs),
+    in stream order. Other subdirectories, such as --index's game_index_parts/, are not read.
     """
+    files = [f for part in ("", PARTITION_GLOB) for pattern in RAW_PATTERNS
+             for f in glob.glob(os.path.join(raw_dir, part, pattern))]
+    return sorted(files)  # partitions sort by month, chunks by number: player ids follow that order
+
+
+def clean_parquet(chunks, out_dir=OUT_DIR, players_file=PLAYERS_FILE):
+    con = duckdb.connect()
+    os.makedirs(out_dir, exist_ok=True)
+    load_players(con, players_file)
+
+    for i, src in enumerate(chunks):
+        out_file = f"{out_dir}/cleaned_chunk_{i:04d}.parquet"
+        print(f"Processing {src} -> {out_file}")
+
+        stage_chunk(con, f"parquet_scan('{src}')")
+
+        sql = f"""
+        COPY ({CLEANED_SQL}
+        ) TO '{out_file}' (FORMAT PARQUET, COMPRESSION 'snappy');
+        """
+
+        con.execute(sql)
+
+    save_players(con, players_file)
+    con.close()
+
+
+def clean_database(db, raw_table="raw_games"):
+    """Everything stays in the database: players persists there, cleaned_games is rebuilt."""
+    con = duckdb.connect(db)
+    source = '"' + raw_table.replace('"', '""') + '"'
+    print(f"Cleaning {db}: {raw_table} -> cleaned_games")
+    con.execute(PLAYERS_DDL)
+    stage_chunk(con, source)
+    con.execute(f"CREATE OR REPLACE TABLE cleaned_games AS{CLEANED_SQL}")
+    print(f"{con.execute('SELECT count(*) FROM cleaned_games').fetchone()[0]} games, "
+          f"{con.execute('SELECT count(*) FROM players').fetchone()[0]} players")
+    con.close()
+
 
-    con.execute(sql)
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Filter and normalise the games from extract_all.py")
+    p.add_argument("--db", default=None,
+                   help="instead of parquet chunks, clean the --raw-table of this database (extract_all.py "
+                        "--output-mode duckdb) into cleaned_games and players tables in the same file")
+    p.add_argument("--raw", default=RAW_DIR,
+                   help=f"directory of extract_all.py chunks (default {RAW_DIR}); per-month subdirectories "
+                        "from a multi-input run are read in month order")
+    p.add_argument("--raw-table", default="raw_games", help="table holding the raw games with --db (default raw_games)")
+    args = p.parse_args()
 
-con.close()
-print("Done.")
+    if args.db:
+        clean_database(args.db, args.raw_table)
+    else:
+        chunks = raw_chunks(args.raw)
+        if not chunks:
+            raise SystemExit(f"no {' / '.join(RAW_PATTERNS)} files under {args.raw}")
+        clean_parquet(chunks)
+    print("Done.")
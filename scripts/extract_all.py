@@ -10,27 +10,604 @@ FIELDS = [
 
 Usage example:
 python scripts\extract_all.py in\lichess_db_standard_rated_2025-09.pgn.zst --out out/raw_games --chunk-games 500000 --sample-games 10000000
+
+--fast-scan skips building a chess.pgn.Game per game: headers are read straight from the
+[Tag "value"] lines and moves_san is taken from the movetext as-is (move numbers, comments,
+NAGs and the result token stripped). Lichess movetext is already canonical SAN, so the rows
+match the full parse, but moves are not checked for legality.
+
+--extra-columns adds per-move columns after moves_san, read from the movetext comments in the
+same pass (both with and without --fast-scan; see EXTRA_COLUMNS):
+  clocks  list<int32>: centiseconds left after each mainline move ([%clk h:mm:ss]), null
+          elements for moves without one, null if the game has none
+  evals   list<int16>: [%eval] after each mainline move from White's view, nulls as for clocks;
+          centipawns clamped to +-30000, mate in n is +-(32000 - n) (see encode_eval). Also adds
+  has_eval  bool: the game has at least one [%eval] (prune on it; can be requested alone)
+  moves_bin list<uint16>: the mainline moves packed as from | to << 6 | promotion << 12
+          (see encode_move/decode_move). --fast-scan has no chess.Move objects, so it replays the
+          SAN for this column; the other columns never need a replay.
+
+--where FIELD OP VALUE keeps only games whose headers match (repeat the flag to AND several).
+It is checked on the header block, so rejected games never have their movetext parsed.
+  FIELD: any PGN tag (Event, WhiteElo, BlackElo, TimeControl, UTCDate, WhiteTitle, ...) or
+         GameType (Blitz, Bullet, ... as in clean.py), InitialTime, Increment, AvgElo
+  OP:    = != < <= > >= in (comma-separated list): numeric when VALUE is a number, otherwise
+         strings in string order, so UTCDate ranges work (2025-09-15 is read as 2025.09.15);
+         ~ (regex search)
+  e.g.   --where "GameType = Blitz" --where "AvgElo >= 1800" --where "UTCDate < 2025.09.08"
+
+--shard I/N processes only the I-th of N ranges of the decompressed stream, so one month can be
+split across machines. Each shard starts at the first game (a line starting with [Event ") at or
+after its split point and stops before the first game of the next shard. With several zstd frames
+the split points are frame starts, and each shard seeks straight to its frame; a single frame must
+record its content size, and shards then decompress, but do not parse, everything before their
+range. A file with a frame that records no content size (e.g. compressed from a pipe) is refused;
+rewrite it with lookup_game.py --reframe first. Run every shard with the same options and its own --out, then
+  python scripts\extract_all.py in.pgn.zst --out out/raw_games --merge-shards out/shard0 out/shard1 ...
+moves the chunks into --out with global numbers and writes one manifest.json / skipped.json.
+
+Several inputs (or a glob pattern, expanded here) are ingested into one partition per month,
+--out/YYYY-MM, with --files-in-flight of them read at once into a shared pool of --workers
+parse processes (see stream_many):
+  python scripts\extract_all.py "in\lichess_db_standard_rated_2025-*.pgn.zst" --out out/raw_games --fast-scan --workers 8
 """
 
 from __future__ import annotations
 
 import argparse
+import bisect
+import codecs
+import glob
+import hashlib
 import io
+import json
+import os
 import logging
+import multiprocessing
+import queue
+import re
+import shutil
+import threading
+import time
 import traceback
+from collections import Counter, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import NamedTuple
 
 import chess.pgn
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import zstandard as zstd
 
 DEFAULT_CHUNK_GAMES = 500_000
+DEFAULT_FLUSH_MB = 256  # flush once the buffered rows hold this much string data
+RSS_CHECK_ROWS = 4096  # how often (in rows) the serial loop checks --max-rss-mb
+RSS_MIN_FLUSH_DIVISOR = 8  # --max-rss-mb never flushes less than 1/8 of --flush-mb (of DEFAULT_FLUSH_MB without it)
+DEFAULT_BLOCK_MB = 4  # decompressed text per worker task
+DEFAULT_QUEUE_DEPTH = 8  # decoded buffers the decompression thread may run ahead
+DEFAULT_BUFFER_MB = 4  # decompressed bytes per queued buffer
+DEFAULT_ROW_GROUP_ROWS = 131_072  # rows per parquet row group in --output-mode stream
+DEFAULT_TARGET_FILE_MB = 512  # roll to a new part file past this size in --output-mode stream
+DEFAULT_METRICS_INTERVAL = 10.0  # seconds between metrics.jsonl records
+DEFAULT_WRITE_QUEUE = 1  # flushed chunks waiting for the background writer (plus the one being written)
+DEFAULT_FILES_IN_FLIGHT = 2  # inputs stream_many reads at once, sharing one parsing pool
+# parse workers are started from a clean process, not forked from one running reader/writer threads
+POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+OUTPUT_MODES = ("chunks", "stream", "duckdb")
+SCHEMAS = ("raw", "typed")
 FNAME_PAD = 4  # width for chunk file numbers
+MANIFEST_NAME = "manifest.json"
+INDEX_NAME = "game_index.parquet"
+INDEX_PARTS_DIR = "game_index_parts"  # per-flush pieces, merged into INDEX_NAME at the end of the run
+INDEX_ROW_GROUP_ROWS = 16_384  # small sorted row groups: a lookup reads one of them
+METRICS_NAME = "metrics.jsonl"
+SKIPPED_NAME = "skipped.json"
+DUCKDB_NAME = "games.duckdb"  # --output-mode duckdb database, unless --duckdb-path is given
+DEFAULT_DUCKDB_TABLE = "raw_games"
+# the rows clean.py throws away; dropped before the movetext is parsed unless overridden
+DEFAULT_SKIP_TITLES = ("BOT",)
+DEFAULT_SKIP_TERMINATIONS = ("Unterminated", "Rules infraction", "Abandoned")
 compression = "snappy"
-parquet_engine = "pyarrow"
+
+FIELDS = [
+    "game_id", "utc_date", "utc_time", "white", "black", "white_elo", "black_elo", "white_rating_diff",
+    "black_rating_diff", "white_title", "black_title", "result", "termination", "timecontrol", "opening", "eco",
+    "event", "moves_san",
+]
+
+RAW_SCHEMA = pa.schema([(f, pa.string()) for f in FIELDS])
+
+# low-cardinality headers (a few to a few thousand values a month) that ColumnBuffer interns
+INTERN_FIELDS = (
+    "utc_date", "white_title", "black_title", "result", "termination", "timecontrol", "opening", "eco", "event",
+)
+
+# --extra-columns: optional per-move columns appended after moves_san (in this order), filled from the
+# same pass over the movetext that produces moves_san (see move_columns)
+EXTRA_COLUMNS = {
+    "clocks": pa.list_(pa.int32()),  # [%clk h:mm:ss] after each mainline move, in centiseconds
+    "evals": pa.list_(pa.int16()),  # [%eval] after each mainline move, White's view (see encode_eval)
+    "has_eval": pa.bool_(),  # any [%eval] in the game; always written with evals
+    "moves_bin": pa.list_(pa.uint16()),  # mainline moves packed by encode_move
+}
+EVAL_MATE = 32_000  # evals: mate in n for White is EVAL_MATE - n, for Black -(EVAL_MATE - n)
+EVAL_CP_LIMIT = 30_000  # centipawn evals are clamped to +-EVAL_CP_LIMIT, so |value| > this means mate
+
+# --index: where each kept game's raw PGN lives in the .pgn.zst (see GameIndex)
+INDEX_SCHEMA = pa.schema([
+    ("game_id", pa.string()),
+    ("offset", pa.int64()),  # decompressed offset of the game's first byte
+    ("length", pa.int32()),  # UTF-8 bytes of the raw game (headers through trailing blank line)
+    ("frame_offset", pa.int64()),  # compressed offset of the zstd frame holding `offset`
+    ("frame_decompressed_offset", pa.int64()),  # decompressed offset that frame starts at
+])
+
+_DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+# --schema typed: the cleaned_games column layout, before clean.py's row filters
+TYPED_SCHEMA = pa.schema([
+    ("game_id", pa.string()),
+    ("game_datetime", pa.timestamp("us")),
+    ("white", pa.string()),
+    ("black", pa.string()),
+    ("white_elo", pa.int16()),
+    ("black_elo", pa.int16()),
+    ("white_rating_diff", pa.int16()),
+    ("black_rating_diff", pa.int16()),
+    ("white_title", _DICT_STRING),
+    ("black_title", _DICT_STRING),
+    ("result", _DICT_STRING),
+    ("termination", _DICT_STRING),
+    ("initial_time_seconds", pa.int32()),
+    ("increment_seconds", pa.int32()),
+    ("opening", _DICT_STRING),
+    ("eco", _DICT_STRING),
+    ("event", _DICT_STRING),
+    ("moves_san", pa.string()),
+])
 
 logger = logging.getLogger(__name__)
 
+# same tag grammar as chess.pgn.TAG_REGEX
+_TAG_RE = re.compile(r"^\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)\s+\"([^\r]*)\"\]\s*$")
+# the same on undecoded bytes: every tag line of a header block in one findall, and the first
+# line that is neither a tag nor blank (where parse_raw_game's movetext starts)
+_TAG_BYTES_RE = re.compile(rb"^\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)[^\S\n]+\"([^\r\n]*)\"\][^\S\n]*$", re.M)
+_MOVETEXT_START_BYTES_RE = re.compile(rb"^(?!\[)[^\S\n]*\S", re.M)
+_MOVETEXT_NOISE_RE = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+")
+_VARIATION_RE = re.compile(r"\([^()]*\)")
+# a SAN token starts after whitespace or a move number ("12." / "12..."); result tokens start with a digit or "*"
+_SAN_TOKEN_RE = re.compile(r"(?:^|(?<=[\s.]))([NBRQKOa-h][A-Za-z0-9=+#-]*)")
+# the same tokens in one left-to-right scan that also keeps comment text and variation brackets
+_MOVETEXT_TOKEN_RE = re.compile(r"\{([^}]*)\}|;[^\n]*|\$\d+|([()])|(?:^|(?<=[\s.})]))([NBRQKOa-h][A-Za-z0-9=+#-]*)")
+# same grammar as chess.pgn's clock annotation
+_CLOCK_RE = re.compile(r"\[%clk\s(\d+):(\d+):(\d+(?:\.\d*)?)\]")
+# same grammar as chess.pgn's eval annotation: "#n" is mate in n, otherwise pawns (an optional ",depth" is ignored)
+_EVAL_RE = re.compile(r"\[%eval\s(?:#([+-]?\d+)|([+-]?(?:\d{0,10}\.\d{1,2}|\d{1,10}\.?)))(?:,\d+)?\]")
+# the month of a Lichess dump name (lichess_db_standard_rated_2025-09.pgn.zst); names its output partition
+_MONTH_RE = re.compile(r"(\d{4}-\d{2})")
+# every Lichess game starts with this line; --shard resynchronises on it
+GAME_START = b'[Event "'
+# chess.pgn.Game() fills the seven tag roster with these when a header is missing
+_TAG_ROSTER_DEFAULTS = {
+    "Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?", "White": "?", "Black": "?", "Result": "*",
+}
+
+class ZstdFrameReader:
+    """
+    Decompress a .zst file (single- or multi-frame) and record where each zstd frame starts.
+
+    frames holds (compressed_offset, decompressed_offset) for every frame start seen so far.
+    Frames decode independently, so reading can begin at any recorded frame start; the
+    decompressed offset must then be passed in so positions stay absolute.
+    """
+
+    def __init__(self, fh, frame_offset: int = 0, frame_decompressed_offset: int = 0,
+                 read_size: int = 1024 * 1024) -> None:
+        self._fh = fh
+        self._fh.seek(frame_offset)
+        self._ctx = zstd.ZstdDecompressor()
+        self._dobj = self._ctx.decompressobj()
+        self._read_size = read_size
+        self._in_pos = frame_offset  # compressed offset of the next unread input byte
+        self._unused = b""
+        self._next_frame: tuple[int, int] | None = None
+        self._out = b""
+        self.produced = frame_decompressed_offset  # decompressed offset just past everything decoded
+        self.consumed = frame_offset  # compressed offset just past everything decoded
+        self.frames: list[tuple[int, int]] = [(frame_offset, frame_decompressed_offset)]
+
+    def _decompress_more(self) -> bool:
+        data, self._unused = self._unused or self._fh.read(self._read_size), b""
+        if not data:
+            return False
+        self._in_pos += len(data)
+        if self._next_frame is not None:
+            self.frames.append(self._next_frame)
+            self._next_frame = None
+        out = self._dobj.decompress(data)
+        self.produced += len(out)
+        self._out += out
+        self.consumed = self._in_pos
+        if self._dobj.eof:
+            self._unused = self._dobj.unused_data
+            self._in_pos -= len(self._unused)
+            self.consumed = self._in_pos
+            self._next_frame = (self._in_pos, self.produced)
+            self._dobj = self._ctx.decompressobj()
+        return True
+
+    def read(self, size: int) -> bytes:
+        """Return up to size decompressed bytes (b"" at end of file)."""
+        while len(self._out) < size and self._decompress_more():
+            pass
+        data, self._out = self._out[:size], self._out[size:]
+        return data
+
+    def skip(self, n: int) -> None:
+        """Discard the next n decompressed bytes without decoding them."""
+        while n > 0:
+            data = self.read(min(n, self._read_size * 8))
+            if not data:
+                raise EOFError("end of zstd stream while skipping to resume offset")
+            n -= len(data)
+
+
+def zstd_frame_table(zst_path: str | Path) -> tuple[list[tuple[int, int]], int] | None:
+    """
+    Walk the zstd frame and block headers of a file without decompressing it.
+
+    Returns ([(compressed_offset, decompressed_offset), ...] per frame, total decompressed size), or
+    None if some frame does not record its content size (e.g. a single frame written from a pipe);
+    then decompressed offsets are only known by decompressing.
+    """
+    frames: list[tuple[int, int]] = []
+    produced = 0
+    with open(zst_path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        pos = 0
+        while pos < size:
+            fh.seek(pos)
+            head = fh.read(18)
+            magic = int.from_bytes(head[:4], "little")
+            if 0x184D2A50 <= magic <= 0x184D2A5F:  # skippable frame
+                pos += 8 + int.from_bytes(head[4:8], "little")
+                continue
+            params = zstd.get_frame_parameters(head)
+            if params.content_size == zstd.CONTENTSIZE_UNKNOWN:
+                return None
+            frames.append((pos, produced))
+            produced += params.content_size
+            block = pos + zstd.frame_header_size(head)
+            while True:
+                fh.seek(block)
+                header = int.from_bytes(fh.read(3), "little")
+                block += 3 + (1 if (header >> 1) & 3 == 1 else header >> 3)  # RLE blocks store one byte
+                if header & 1:
+                    break
+            pos = block + (4 if params.has_checksum else 0)
+    return frames, produced
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """ "i/N" -> (i, N) with 0 <= i < N."""
+    i, sep, n = spec.partition("/")
+    try:
+        i, n = int(i), int(n)
+    except ValueError:
+        raise ValueError(f"shard must look like i/N, got {spec!r}") from None
+    if not sep or n < 1 or not 0 <= i < n:
+        raise ValueError(f"shard must be i/N with 0 <= i < N, got {spec!r}")
+    return i, n
+
+
+def shard_bounds(zst_path: str | Path, shard: int, shards: int) -> dict:
+    """
+    Decompressed range of shard `shard` of `shards` for --shard.
+
+    With several zstd frames the split points are the first frame starting at or after each
+    1/shards of the compressed file, so a shard seeks straight to its frame. A single frame is
+    split evenly by decompressed size (every shard but the first still decompresses everything
+    before its range, which is much cheaper than parsing it). The actual shard boundaries are the
+    first game starting at or after these points; neighbouring shards compute the same ones, so
+    every game is processed by exactly one shard.
+    """
+    table = zstd_frame_table(zst_path)
+    if table is None:
+        raise ValueError(f"{zst_path} does not record frame content sizes, so it cannot be split without "
+                         "decompressing it; rewrite it with lookup_game.py --reframe first")
+    frames, total = table
+    size = Path(zst_path).stat().st_size
+
+    def point(k: int) -> int | None:
+        if k == 0:
+            return 0
+        if k == shards:
+            return None
+        if len(frames) > 1:
+            return next((d for c, d in frames if c >= size * k // shards), total)
+        return total * k // shards
+
+    start = point(shard)
+    frame = frames[bisect.bisect_right(frames, start, key=lambda f: f[1]) - 1] if frames else (0, 0)
+    return {"index": shard, "count": shards, "start": start, "stop": point(shard + 1),
+            "frame_offset": frame[0], "frame_decompressed_offset": frame[1]}
+
+
+class PrefetchTextReader:
+    """
+    Decompress and decode a .pgn.zst ahead of the parser.
+
+    The producer reads buffer_bytes of decompressed data at a time, cuts it at the last newline,
+    decodes it and puts the text on a queue of at most queue_depth buffers. It runs in a dedicated
+    thread (zstandard releases the GIL while decompressing) so it overlaps with parsing in the main
+    thread; queue_depth == 0 decompresses inline instead. The reader exposes readline(), read()
+    and line iteration, which is all chess.pgn.read_game and the splitters need.
+
+    binary: hand out the decompressed bytes as they are (bytes from readline/read/iteration)
+            and leave decoding to the consumer, which then only decodes what it keeps.
+
+    start: (frame_offset, frame_decompressed_offset, decompressed_offset) to begin at a checkpoint.
+           Decompression starts at the zstd frame and skips forward to decompressed_offset, which
+           must be the start of a game. Without it a UTF-8 BOM and blank lines at the start of
+           the stream are skipped, so start_offset is the offset of the first game.
+    resync: decompressed_offset may be anywhere; start at the first game at or after it instead
+            (start_offset is then that game's offset).
+    stop: end the stream just before the first game starting at or after this decompressed offset.
+
+    producer_stall: seconds the decompressor waited on a full queue (parsing is the limit)
+    consumer_stall: seconds the parser waited on an empty queue (decompression is the limit)
+    decompress_seconds: time spent decompressing and decoding, whichever thread did it
+    """
+
+    def __init__(self, zst_path: str | Path, queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                 buffer_bytes: int = DEFAULT_BUFFER_MB * 1024 * 1024,
+                 start: tuple[int, int, int] | None = None, resync: bool = False,
+                 stop: int | None = None, binary: bool = False) -> None:
+        self.zst_path = Path(zst_path)
+        self.buffer_bytes = buffer_bytes
+        self.binary = binary
+        self.producer_stall = 0.0
+        self.consumer_stall = 0.0
+        self.decompress_seconds = 0.0
+        frame_offset, frame_decompressed_offset, self.start_offset = start or (0, 0, 0)
+        self._fh = open(self.zst_path, "rb")
+        self._raw = ZstdFrameReader(self._fh, frame_offset, frame_decompressed_offset)
+        self.stop_offset = stop
+        self._head: bytes | None = None  # bytes already read by _resync / _skip_preamble
+        if resync:
+            self.start_offset = self._resync(self.start_offset)
+        elif self.start_offset == 0:
+            self.start_offset = self._skip_preamble()
+        self._eof = False
+        self._empty = b"" if binary else ""
+        self._nl = b"\n" if binary else "\n"
+        self._pending = self._empty
+        self._pos = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._buffers = self._iter_buffers()
+        if queue_depth > 0:
+            self._queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+            self._thread = threading.Thread(target=self._produce, name="zstd-prefetch", daemon=True)
+            self._thread.start()
+
+    @property
+    def frames(self) -> list[tuple[int, int]]:
+        return self._raw.frames
+
+    @property
+    def compressed_bytes(self) -> int:
+        """Compressed input decoded so far (read-ahead included)."""
+        return self._raw.consumed
+
+    @property
+    def queued_buffers(self) -> int:
+        return self._queue.qsize() if self._thread is not None else 0
+
+    def frame_at(self, offset: int) -> tuple[int, int]:
+        """(compressed_offset, decompressed_offset) of the last known frame starting at or before offset."""
+        frames = self._raw.frames
+        return frames[bisect.bisect_right(frames, offset, key=lambda f: f[1]) - 1]
+
+    def _resync(self, offset: int) -> int:
+        """
+        Position the stream at the first game starting at or after offset (a line beginning with
+        GAME_START) and return that game's offset. Everything before it is decompressed and
+        discarded; one byte of look-behind is read when offset is not the start of a frame.
+        """
+        raw = self._raw
+        behind = 1 if offset > raw.produced else 0
+        raw.skip(offset - behind - raw.produced)
+        pos = offset - behind  # decompressed offset of data[0]
+        data = raw.read(self.buffer_bytes)
+        if not behind and data.startswith(GAME_START):
+            self._head = data
+            return pos
+        while True:
+            i = data.find(b"\n" + GAME_START)
+            if i >= 0:
+                self._head = data[i + 1:]
+                return pos + i + 1
+            more = raw.read(self.buffer_bytes)
+            if not more:
+                self._head = b""
+                return pos + len(data)
+            tail = data[-len(GAME_START):]
+            pos += len(data) - len(tail)
+            data = tail + more
+
+    def _skip_preamble(self) -> int:
+        """Drop a UTF-8 BOM and whole blank lines at the start of the stream; return their length."""
+        data = self._raw.read(self.buffer_bytes)
+        body = data.removeprefix(codecs.BOM_UTF8)
+        first = len(body) - len(body.lstrip())  # the first non-blank byte
+        cut = body.rfind(b"\n", 0, first) + 1  # the start of its line
+        self._head = body[cut:]
+        return len(data) - len(body) + cut
+
+    def _decode(self, data: bytes) -> str | bytes:
+        if self.binary:
+            return data
+        t0 = time.perf_counter()
+        text = data.decode("utf-8", errors="replace")
+        self.decompress_seconds += time.perf_counter() - t0
+        return text
+
+    def _iter_buffers(self) -> Iterator[str | bytes]:
+        raw = self._raw
+        if self._head is None:
+            raw.skip(self.start_offset - raw.produced)
+        check_boundary = self.start_offset > 0 and self._head is None
+        carry = self._head or b""
+        pos = self.start_offset  # decompressed offset of the next byte handed out
+        stop = self.stop_offset
+        at_boundary = stop is not None and pos >= stop  # the next line would start a game at/after stop
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            data = raw.read(self.buffer_bytes)
+            self.decompress_seconds += time.perf_counter() - t0
+            if not data:
+                if not carry:
+                    break
+                data, carry = carry, b""  # last piece, possibly without a final newline
+                cut = len(data)
+            else:
+                data = carry + data
+                cut = data.rfind(b"\n") + 1
+                if cut == 0:
+                    carry = data
+                    continue
+                carry = data[cut:]
+            if check_boundary:
+                if not data.lstrip()[:1] == b"[":
+                    raise ValueError(f"offset {self.start_offset} in {self.zst_path} is not at the start of a game")
+                check_boundary = False
+            chunk = data[:cut]
+            if stop is not None:
+                # end just before the first game that starts at or after stop
+                if at_boundary and chunk.startswith(GAME_START):
+                    return
+                i = chunk.find(b"\n" + GAME_START, max(0, stop - 1 - pos))
+                if i >= 0:
+                    yield self._decode(chunk[:i + 1])
+                    return
+                at_boundary = pos + len(chunk) >= stop
+            pos += len(chunk)
+            yield self._decode(chunk)
+
+    def _put(self, item) -> None:
+        t0 = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.producer_stall += time.perf_counter() - t0
+
+    def _produce(self) -> None:
+        try:
+            for text in self._buffers:
+                self._put(text)
+            self._put(None)
+        except BaseException as exc:  # surfaced to the parser thread
+            self._put(exc)
+
+    def _next_buffer(self) -> str | bytes | None:
+        if self._eof:
+            return None
+        if self._thread is None:
+            item = next(self._buffers, None)
+        else:
+            t0 = time.perf_counter()
+            item = self._queue.get()
+            self.consumer_stall += time.perf_counter() - t0
+        if item is None:
+            self._eof = True
+            return None
+        if isinstance(item, BaseException):
+            self._eof = True
+            raise item
+        return item
+
+    def readline(self) -> str | bytes:
+        while True:
+            i = self._pending.find(self._nl, self._pos)
+            if i >= 0:
+                line = self._pending[self._pos:i + 1]
+                self._pos = i + 1
+                return line
+            nxt = self._next_buffer()
+            if nxt is None:
+                line = self._pending[self._pos:]
+                self._pending, self._pos = self._empty, 0
+                return line
+            self._pending, self._pos = self._pending[self._pos:] + nxt, 0
+
+    def read(self, size: int = -1) -> str | bytes:
+        parts = [self._pending[self._pos:]]
+        n = len(parts[0])
+        self._pending, self._pos = self._empty, 0
+        while size < 0 or n < size:
+            nxt = self._next_buffer()
+            if nxt is None:
+                break
+            parts.append(nxt)
+            n += len(nxt)
+        data = self._empty.join(parts)
+        if 0 <= size < len(data):
+            self._pending = data[size:]
+            data = data[:size]
+        return data
+
+    def __iter__(self) -> Iterator[str | bytes]:
+        nl = self._nl
+        while True:
+            data = self._pending[self._pos:] or self._next_buffer()
+            self._pending, self._pos = self._empty, 0
+            if not data:
+                return
+            lines = data.split(nl)
+            tail = lines.pop()
+            for line in lines:
+                yield line + nl
+            if tail:
+                nxt = self._next_buffer()
+                if nxt is None:
+                    yield tail
+                    return
+                self._pending = tail + nxt
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._fh.close()
+        logger.info("Prefetch stalls: decompressor waited %.1fs on parser, parser waited %.1fs on decompressor",
+                    self.producer_stall, self.consumer_stall)
+
+    def __enter__(self) -> PrefetchTextReader:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_pgn_text(zst_path: str | Path, queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                  buffer_mb: int = DEFAULT_BUFFER_MB,
+                  start: tuple[int, int, int] | None = None, resync: bool = False,
+                  stop: int | None = None, binary: bool = False) -> PrefetchTextReader:
+    """
+    Open a .pgn.zst as a text stream (use as a context manager). With queue_depth > 0
+    decompression runs ahead in a background thread; queue_depth == 0 decompresses inline.
+    binary=True yields undecoded bytes (see PrefetchTextReader).
+    """
+    return PrefetchTextReader(zst_path, queue_depth, buffer_mb * 1024 * 1024, start, resync, stop, binary)
+
+
 def san_moves_from_game(game: chess.pgn.Game) -> str:
     """Return moves in SAN for the mainline of `game` as a single space-separated string."""
     board = game.board()
@@ -42,23 +619,221 @@ def san_moves_from_game(game: chess.pgn.Game) -> str:
     return " ".join(tokens)
 
 
-def process_game(game: chess.pgn.Game, game_index: int | None = None) -> dict[str, str]:
+def annotated_moves_from_game(game: chess.pgn.Game) -> tuple[list[str], list[str], list[chess.Move]]:
+    """Mainline moves of `game` in SAN, the comment after each of them ("" if none) and the moves themselves."""
+    board = game.board()
+    sans: list[str] = []
+    comments: list[str] = []
+    moves: list[chess.Move] = []
+    for node in game.mainline():
+        sans.append(board.san(node.move))
+        board.push(node.move)
+        comments.append(node.comment)
+        moves.append(node.move)
+    return sans, comments, moves
+
+
+def moves_from_sans(sans: list[str]) -> list[chess.Move]:
+    """Replay SAN tokens from the standard start position (for moves_bin with --fast-scan)."""
+    board = chess.Board()
+    return [board.push_san(san) for san in sans]
+
+
+def encode_move(move: chess.Move) -> int:
+    """16-bit moves_bin code: from square (bits 0-5), to square (6-11), promotion piece type (12-15, 0 = none)."""
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code: int) -> chess.Move:
+    """Inverse of encode_move; replaying decoded moves with Board.push skips SAN parsing."""
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+
+def iter_raw_games(lines: Iterable[str]) -> Iterator[str]:
     """
-    Extract fields from a chess.pgn.Game object.
-    Returns a dict with all keys but replacing site with game_id as they are all unique and all played on lichess
+    Split a PGN line stream into raw game strings (header block + movetext).
+    A new game starts at the first tag line that follows movetext. Blank lines stay with the game
+    they precede or follow, so the yielded strings cover the stream byte for byte (only text
+    before the first tag line is dropped).
+    """
+    game: list[str] = []
+    has_tags = False
+    in_movetext = False
+    for line in lines:
+        if line[:1] == "[" and line[:2] != "[%":
+            if in_movetext:
+                if has_tags:
+                    yield "".join(game)
+                game = []
+                in_movetext = False
+            has_tags = True
+        elif not line.isspace() and line:
+            in_movetext = True
+        game.append(line)
+    if game and has_tags:
+        yield "".join(game)
 
-    game_index: optional integer for logging context (may be None).
+
+def iter_raw_game_bytes(block: bytes) -> Iterator[bytes]:
+    """
+    Split undecoded PGN into raw games at lines starting with GAME_START, like --shard and the
+    block splitter (so, unlike iter_raw_games, this relies on every game having an Event tag
+    first, as Lichess exports do). Bytes before the first game are dropped; the yielded games
+    cover the rest byte for byte. Boundaries are found with bytes.find, not a Python loop per line.
+    """
+    sep = b"\n" + GAME_START
+    if block.startswith(GAME_START):
+        start = 0
+    else:
+        start = block.find(sep) + 1
+        if start == 0:
+            return
+    while True:
+        end = block.find(sep, start) + 1
+        if end == 0:
+            yield block[start:]
+            return
+        yield block[start:end]
+        start = end
+
+
+def parse_raw_game_bytes(raw: bytes) -> tuple[dict[str, str], bytes]:
     """
-    h = game.headers
+    parse_raw_game for an undecoded game from iter_raw_game_bytes: (headers, movetext bytes).
+    Only the tag values are decoded; the caller decodes the movetext if it keeps the game.
+    """
+    m = _MOVETEXT_START_BYTES_RE.search(raw)
+    end = m.start() if m else len(raw)
+    headers = dict(_TAG_ROSTER_DEFAULTS)
+    for name, value in _TAG_BYTES_RE.findall(raw, 0, end):
+        headers[name.decode("ascii")] = value.decode("utf-8", errors="replace")
+    return headers, raw[end:]
+
+
+def parse_raw_game(raw: str) -> tuple[dict[str, str], str]:
+    """Return (headers, movetext) for one raw game string from iter_raw_games."""
+    headers = dict(_TAG_ROSTER_DEFAULTS)
+    lines = raw.split("\n")
+    i = 0
+    for i, line in enumerate(lines):
+        m = _TAG_RE.match(line)
+        if m:
+            headers[m.group(1)] = m.group(2)
+        elif line[:1] != "[" and line.strip():
+            break
+    else:
+        i = len(lines)
+    return headers, "\n".join(lines[i:])
+
+
+def san_moves_from_movetext(movetext: str) -> str:
+    """Return the mainline SAN tokens of raw movetext as a single space-separated string."""
+    text = _MOVETEXT_NOISE_RE.sub(" ", movetext)
+    while "(" in text:
+        stripped = _VARIATION_RE.sub(" ", text)
+        if stripped == text:
+            break
+        text = stripped
+    return " ".join(_SAN_TOKEN_RE.findall(text))
+
+
+def annotated_moves_from_movetext(movetext: str) -> tuple[list[str], list[str]]:
+    """
+    Fast-scan counterpart of annotated_moves_from_game: the mainline SAN tokens of raw movetext
+    (as san_moves_from_movetext) and the text of the comments following each of them.
+    """
+    sans: list[str] = []
+    comments: list[str] = []
+    depth = 0
+    for comment, bracket, san in _MOVETEXT_TOKEN_RE.findall(movetext):
+        if bracket:
+            depth = depth + 1 if bracket == "(" else max(depth - 1, 0)
+        elif depth:
+            continue
+        elif san:
+            sans.append(san)
+            comments.append("")
+        elif comment and comments:
+            comments[-1] = f"{comments[-1]} {comment.strip()}" if comments[-1] else comment.strip()
+    return sans, comments
+
+
+def clocks_from_comments(comments: list[str]) -> list[int | None] | None:
+    """Centiseconds on the clock after each move (None where a move has no [%clk]); None if no move has one."""
+    clocks: list[int | None] = []
+    found = False
+    for comment in comments:
+        m = _CLOCK_RE.search(comment) if comment else None
+        if m is None:
+            clocks.append(None)
+            continue
+        found = True
+        clocks.append(int(m.group(1)) * 360_000 + int(m.group(2)) * 6_000 + round(float(m.group(3)) * 100))
+    return clocks if found else None
+
+
+def encode_eval(mate: str | None, pawns: str | None) -> int:
+    """
+    int16 code for one [%eval]: centipawns from White's view clamped to +-EVAL_CP_LIMIT, or
+    +-(EVAL_MATE - n) for mate in n (sign = side that mates). decode: |v| > EVAL_CP_LIMIT is mate
+    in EVAL_MATE - |v| moves.
+    """
+    if mate is not None:
+        n = min(abs(int(mate)), EVAL_MATE - EVAL_CP_LIMIT - 1)
+        return -(EVAL_MATE - n) if mate.startswith("-") else EVAL_MATE - n
+    return max(-EVAL_CP_LIMIT, min(EVAL_CP_LIMIT, round(float(pawns) * 100)))
+
+
+def evals_from_comments(comments: list[str]) -> list[int | None] | None:
+    """encode_eval of the [%eval] after each move (None where a move has none); None if no move has one."""
+    evals: list[int | None] = []
+    found = False
+    for comment in comments:
+        m = _EVAL_RE.search(comment) if comment else None
+        if m is None:
+            evals.append(None)
+            continue
+        found = True
+        evals.append(encode_eval(m.group(1), m.group(2)))
+    return evals if found else None
+
+
+def move_columns(comments: list[str] | None, extra_columns: Iterable[str],
+                 moves: list[chess.Move] | None = None) -> dict:
+    """
+    Values of the requested EXTRA_COLUMNS for one game, in EXTRA_COLUMNS order, from the per-move
+    comments of annotated_moves_from_*; all None if the moves could not be read (comments is None).
+    moves_bin comes from `moves` (None if they are unknown).
+    """
+    wanted = set(extra_columns)
+    values = {}
+    if "clocks" in wanted:
+        values["clocks"] = clocks_from_comments(comments) if comments is not None else None
+    if "evals" in wanted or "has_eval" in wanted:
+        evals = evals_from_comments(comments) if comments is not None else None
+        if "evals" in wanted:
+            values["evals"] = evals
+        values["has_eval"] = evals is not None if comments is not None else None
+    if "moves_bin" in wanted:
+        values["moves_bin"] = [encode_move(mv) for mv in moves] if moves is not None else None
+    return values
+
+
+def raw_schema(extra_columns: Iterable[str] = ()) -> pa.Schema:
+    """RAW_SCHEMA followed by the requested EXTRA_COLUMNS (in EXTRA_COLUMNS order); evals brings has_eval."""
+    wanted = set(extra_columns)
+    if "evals" in wanted:
+        wanted.add("has_eval")
+    unknown = wanted - EXTRA_COLUMNS.keys()
+    if unknown:
+        raise ValueError(f"unknown extra columns {sorted(unknown)}; choose from {list(EXTRA_COLUMNS)}")
+    return pa.schema(list(RAW_SCHEMA) + [pa.field(name, t) for name, t in EXTRA_COLUMNS.items() if name in wanted])
+
+
+def _row_from_headers(h, moves_san: str) -> dict[str, str]:
+    """Build the FIELDS row from a header mapping and the SAN string."""
     site = h.get("Site", "")
     gid = site.rsplit("/", 1)[-1] if site else None
-    try:
-        moves_san = san_moves_from_game(game)
-    except Exception:
-        moves_san = "<ERROR_SAN>"
-        logger.warning("SAN extraction error at idx=%s", game_index)
-        logger.debug(traceback.format_exc())
-
     return {
         "game_id": gid,
         "utc_date": h.get("UTCDate", ""),
@@ -79,95 +854,1778 @@ def process_game(game: chess.pgn.Game, game_index: int | None = None) -> dict[st
         "event": h.get("Event",""),
         "moves_san": moves_san
     }
-    
+
+
+def process_game(game: chess.pgn.Game, game_index: int | None = None) -> dict[str, str]:
+    """
+    Extract fields from a chess.pgn.Game object.
+    Returns a dict with all keys but replacing site with game_id as they are all unique and all played on lichess
+
+    game_index: optional integer for logging context (may be None).
+    """
+    return _row_from_headers(game.headers, _safe_san_moves(game, game_index))
+
+
+def _safe_san_moves(game: chess.pgn.Game, game_index: int | None = None) -> str:
+    """san_moves_from_game, or "<ERROR_SAN>" (logged) if the replay fails."""
+    try:
+        return san_moves_from_game(game)
+    except Exception:
+        logger.warning("SAN extraction error at idx=%s", game_index)
+        logger.debug(traceback.format_exc())
+        return "<ERROR_SAN>"
+
+
+def _safe_annotated_moves(game: chess.pgn.Game, game_index: int | None = None
+                          ) -> tuple[str, list[str] | None, list[chess.Move] | None]:
+    """
+    annotated_moves_from_game as (moves_san, comments, moves), or ("<ERROR_SAN>", None, None)
+    (logged) if the replay fails.
+    """
+    try:
+        sans, comments, moves = annotated_moves_from_game(game)
+    except Exception:
+        logger.warning("SAN extraction error at idx=%s", game_index)
+        logger.debug(traceback.format_exc())
+        return "<ERROR_SAN>", None, None
+    return " ".join(sans), comments, moves
+
+
+def _safe_moves_from_sans(sans: list[str], game_index: int | None = None) -> list[chess.Move] | None:
+    """moves_from_sans, or None (logged) if a token is not a legal move."""
+    try:
+        return moves_from_sans(sans)
+    except ValueError:
+        logger.warning("SAN replay error at idx=%s", game_index)
+        logger.debug(traceback.format_exc())
+        return None
+
+
+def sample_key(game_id: str) -> int:
+    """Stable 64-bit hash of a game_id: the first 8 bytes of md5(game_id), big-endian."""
+    return int.from_bytes(hashlib.md5(game_id.encode("utf-8")).digest()[:8], "big")
+
+
+def in_sample(game_id: str | None, rate: float) -> bool:
+    """
+    True if game_id is in the --sample-rate `rate` sample (sample_key < rate * 2**64).
+
+    The decision depends only on the id, so every stage (extract_all, extract_results, ...)
+    selects the same games, and a smaller rate selects a subset of a larger one.
+    """
+    return sample_key(game_id or "") < int(rate * 2**64)
+
+
+class HeaderFilter:
+    """
+    Header predicates checked before a game's movetext is parsed or a board is built.
+    reject() returns the skip reason (used as the counter key) or None to keep the game.
+    Holds plain data only, so it pickles to worker processes.
+
+    sample_rate: keep only games whose game_id (from the Site header) is in_sample; checked
+                 first, so the other reasons are counted within the sample.
+    """
+
+    def __init__(self, skip_titles: Iterable[str] = DEFAULT_SKIP_TITLES,
+                 skip_terminations: Iterable[str] = DEFAULT_SKIP_TERMINATIONS,
+                 where: Iterable[str] = (), sample_rate: float | None = None) -> None:
+        if sample_rate is not None and not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        self.skip_titles = frozenset(skip_titles)
+        self.skip_terminations = frozenset(skip_terminations)
+        self.where = [parse_where(expr) for expr in where]
+        self.sample_rate = sample_rate
+        self._sample_below = int(sample_rate * 2**64) if sample_rate is not None and sample_rate < 1.0 else None
+
+    def __bool__(self) -> bool:
+        return bool(self.skip_titles or self.skip_terminations or self.where or self._sample_below is not None)
+
+    def describe(self) -> dict:
+        """Settings as plain JSON, for the manifest."""
+        return {"skip_titles": sorted(self.skip_titles), "skip_terminations": sorted(self.skip_terminations),
+                "where": [clause[3] for clause in self.where], "sample_rate": self.sample_rate}
+
+    def reject(self, headers) -> str | None:
+        if self._sample_below is not None:
+            site = headers.get("Site", "")
+            if sample_key(site.rsplit("/", 1)[-1] if site else "") >= self._sample_below:
+                return "sample"
+        for key in ("WhiteTitle", "BlackTitle"):
+            title = headers.get(key, "")
+            if title in self.skip_titles:
+                return f"title={title}"
+        termination = headers.get("Termination", "")
+        if termination in self.skip_terminations:
+            return f"termination={termination}"
+        for clause in self.where:
+            if not _where_matches(clause, headers):
+                return f"where {clause[3]}"
+        return None
+
+
+_WHERE_RE = re.compile(r"^\s*([A-Za-z][A-Za-z0-9_]*)\s*(<=|>=|!=|=|<|>|~|\s+in\s+)\s*(.*?)\s*$")
+_WHERE_NUMBER_RE = re.compile(r"^[+-]?(?:\d+\.?\d*|\.\d+)$")
+_GAME_TYPES = ("Blitz", "Bullet", "UltraBullet", "Correspondence", "Classical", "Rapid")
+
+
+def _header_value(headers, field: str) -> str:
+    """Tag value for --where, including the derived fields GameType/InitialTime/Increment/AvgElo."""
+    if field == "GameType":
+        words = headers.get("Event", "").split(" ")
+        return words[0] if words[0] in _GAME_TYPES else (words[1] if len(words) > 1 else "")
+    if field in ("InitialTime", "Increment"):
+        parts = headers.get("TimeControl", "").split("+")
+        i = 0 if field == "InitialTime" else 1
+        return parts[i] if len(parts) > i else ""
+    if field == "AvgElo":
+        try:
+            return str((int(headers.get("WhiteElo", "")) + int(headers.get("BlackElo", ""))) / 2)
+        except ValueError:
+            return ""
+    return headers.get(field, "")
+
+
+def parse_where(expr: str) -> tuple:
+    """Parse one --where expression into a picklable (field, op, value, expr) clause."""
+    m = _WHERE_RE.match(expr)
+    if not m:
+        raise ValueError(f"cannot parse --where {expr!r}; expected FIELD OP VALUE")
+    field, op, value = m.group(1), m.group(2).strip(), m.group(3).strip("\"'")
+    if op == "in":
+        value = frozenset(_where_operand(field, v.strip()) for v in value.split(","))
+    elif op == "~":
+        value = re.compile(value)
+    else:
+        value = _where_operand(field, value)
+    return field, op, value, expr
+
+
+def _where_operand(field: str, value: str) -> float | str:
+    """A --where VALUE as compared: a float if it is a number, dates as YYYY.MM.DD, else the string."""
+    if _WHERE_NUMBER_RE.match(value):
+        return float(value)
+    if field == "UTCDate" or field == "Date":
+        return value.replace("-", ".")
+    return value
+
+
+def _where_matches(clause: tuple, headers) -> bool:
+    field, op, value, _ = clause
+    actual = _header_value(headers, field)
+    if op == "~":
+        return value.search(actual) is not None
+    # numbers compare as numbers ("1800" = "1800.0"); a non-numeric header never equals one
+    number = float(actual) if _WHERE_NUMBER_RE.match(actual) else None
+    if op == "in":
+        return actual in value or (number is not None and number in value)
+    if isinstance(value, float):
+        if number is None:
+            return op == "!="
+        actual = number
+    if op == "=":
+        return actual == value
+    if op == "!=":
+        return actual != value
+    if op == "<":
+        return actual < value
+    if op == "<=":
+        return actual <= value
+    if op == ">":
+        return actual > value
+    return actual >= value
+
+
+class _FilteringGameBuilder(chess.pgn.GameBuilder):
+    """GameBuilder that applies header_filter as soon as the headers are read; a rejected game's movetext is skipped."""
+
+    def __init__(self, header_filter: HeaderFilter | None) -> None:
+        super().__init__()
+        self.header_filter = header_filter
+        self.reason: str | None = None
+
+    def end_headers(self):
+        if self.header_filter:
+            self.reason = self.header_filter.reject(self.game.headers)
+            if self.reason is not None:
+                return chess.pgn.SKIP
+        return None
+
+
+def _extract(raw: str | bytes, game_index: int | None, fast_scan: bool, header_filter: HeaderFilter | None,
+             times: Counter | None = None, extra_columns: tuple[str, ...] = ()) -> tuple[dict | None, str | None]:
+    """
+    (row, None) for one raw game, or (None, reason) if header_filter rejects it from the headers alone.
+    Without fast_scan the game is read by chess.pgn.read_game alone, which applies header_filter
+    once the headers are read (see _FilteringGameBuilder). raw may be undecoded bytes from
+    iter_raw_game_bytes: then with fast_scan only the tag values are decoded before filtering,
+    and the movetext only if the game is kept.
+
+    times: if given, seconds spent are added under "headers" (tag parsing and filtering; without
+           fast_scan all of chess.pgn.read_game), "san" (san_moves_from_game, or
+           san_moves_from_movetext with fast_scan; with extra_columns the annotated_moves_from_*
+           variants and move_columns) and "row" (_row_from_headers).
+    extra_columns: EXTRA_COLUMNS to add to the row, in EXTRA_COLUMNS order.
+    """
+    t0 = time.perf_counter()
+    binary = isinstance(raw, bytes)
+    if fast_scan:
+        headers, movetext = parse_raw_game_bytes(raw) if binary else parse_raw_game(raw)
+        reason = header_filter.reject(headers) if header_filter else None
+    else:
+        builder = _FilteringGameBuilder(header_filter)
+        game = chess.pgn.read_game(io.StringIO(raw.decode("utf-8", errors="replace") if binary else raw),
+                                   Visitor=lambda: builder)
+        headers, reason = game.headers, builder.reason
+    if reason is not None:
+        if times is not None:
+            times["headers"] += time.perf_counter() - t0
+        return None, reason
+    t1 = time.perf_counter()
+    extra = None
+    if fast_scan:
+        if binary:
+            movetext = movetext.decode("utf-8", errors="replace")
+        if extra_columns:
+            sans, comments = annotated_moves_from_movetext(movetext)
+            moves = _safe_moves_from_sans(sans, game_index) if "moves_bin" in extra_columns else None
+            moves_san, extra = " ".join(sans), move_columns(comments, extra_columns, moves)
+        else:
+            moves_san = san_moves_from_movetext(movetext)
+    else:
+        if extra_columns:
+            moves_san, comments, moves = _safe_annotated_moves(game, game_index)
+            extra = move_columns(comments, extra_columns, moves)
+        else:
+            moves_san = _safe_san_moves(game, game_index)
+    t2 = time.perf_counter()
+    row = _row_from_headers(headers, moves_san)
+    if extra:
+        row.update(extra)
+    if times is not None:
+        t3 = time.perf_counter()
+        times["headers"] += t1 - t0
+        times["san"] += t2 - t1
+        times["row"] += t3 - t2
+    return row, None
+
+
+def _nbytes(raw: str | bytes) -> int:
+    """UTF-8 size of a raw game, i.e. how far it advances the decompressed offset."""
+    if isinstance(raw, bytes) or raw.isascii():
+        return len(raw)
+    return len(raw.encode("utf-8"))
+
+
+def _row_nbytes(row: dict) -> int:
+    """
+    Approximate buffered size of one row: characters in its values (elements for the list-valued
+    EXTRA_COLUMNS) plus an offset per column.
+    """
+    return sum(len(v) for v in row.values() if v and v is not True) + 4 * len(row)
+
+
+def current_rss_bytes() -> int | None:
+    """Resident set size of this process, or None if it cannot be read (no psutil and no /proc)."""
+    try:
+        import psutil
+    except ImportError:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+    return psutil.Process().memory_info().rss
+
+
+def iter_game_blocks(text, block_chars: int) -> Iterator[str | bytes]:
+    """
+    Read `text` in pieces of about block_chars and yield game-aligned blocks.
+    Blocks are cut just before a blank line followed by a tag line (the start of a Lichess game);
+    from a binary reader they are bytes, cut just before a line starting with GAME_START.
+    """
+    binary = getattr(text, "binary", False)
+    carry, sep, keep = (b"", b"\n" + GAME_START, 1) if binary else ("", "\n\n[", 2)
+    while True:
+        piece = text.read(block_chars)
+        if not piece:
+            break
+        data = carry + piece
+        cut = data.rfind(sep)
+        if cut < 0:
+            carry = data
+            continue
+        yield data[:cut + keep]
+        carry = data[cut + keep:]
+    if carry.strip():
+        yield carry
+
+
+class ColumnBuffer:
+    """
+    Per-column builders for extracted rows.
+
+    Values go into one plain list per column and are sealed into pyarrow arrays every SEAL_ROWS
+    rows, so a large chunk is held as Arrow buffers rather than as hundreds of thousands of
+    Python dicts/strings. to_table()/take() return pyarrow Tables; pandas is not involved.
+
+    Columns in `intern` (low-cardinality headers) are interned as they are appended: each value is
+    looked up in a per-column dictionary that lives as long as the buffer and only its int code is
+    kept, so they are held as dictionary arrays (int32 codes + one copy of each distinct value)
+    and decoded back to the schema type when a table is handed out. intern_stats() reports
+    lookups and hit rates.
+    """
+
+    SEAL_ROWS = 65_536
+
+    def __init__(self, schema: pa.Schema = RAW_SCHEMA, intern: Iterable[str] = ()) -> None:
+        self.schema = schema
+        self._lists: list[list] = [[] for _ in schema.names]
+        self._chunks: list[list[pa.Array]] = [[] for _ in schema.names]
+        self._sealed = 0
+        intern = set(intern)
+        self._codes: list[dict[str, int] | None] = [{} if name in intern else None for name in schema.names]
+        self._appended = 0
+        self._lookups: Counter = Counter()  # interned values in batches added with extend()
+        self._misses: Counter = Counter()
+
+    def __len__(self) -> int:
+        return self._sealed + len(self._lists[0])
+
+    def append(self, row: dict) -> None:
+        """Add one row; values must be in schema order (as built by _row_from_headers)."""
+        for col, codes, value in zip(self._lists, self._codes, row.values()):
+            if codes is not None and value is not None:
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                value = code
+            col.append(value)
+        self._appended += 1
+        if len(self._lists[0]) >= self.SEAL_ROWS:
+            self._seal()
+
+    def extend(self, table: pa.Table, intern_stats: dict[str, tuple[int, int]] | None = None) -> None:
+        """
+        Add the rows of a Table with the same schema (e.g. a worker batch) without copying.
+        Columns may be dictionary-encoded (as from to_table(decode=False)); intern_stats are the
+        (lookups, misses) behind them, added to this buffer's intern_stats().
+        """
+        self._seal()
+        for chunks, column in zip(self._chunks, table.columns):
+            chunks.extend(column.chunks)
+        self._sealed += table.num_rows
+        for name, (lookups, misses) in (intern_stats or {}).items():
+            self._lookups[name] += lookups
+            self._misses[name] += misses
+
+    def intern_stats(self) -> dict[str, tuple[int, int]]:
+        """(lookups, misses) per interned column; a miss is a value seen for the first time."""
+        return {name: (self._appended + self._lookups[name], len(codes) + self._misses[name])
+                for name, codes in zip(self.schema.names, self._codes) if codes is not None}
+
+    def _seal(self) -> None:
+        n = len(self._lists[0])
+        if not n:
+            return
+        for field, col, chunks, codes in zip(self.schema, self._lists, self._chunks, self._codes):
+            if codes is None:
+                chunks.append(pa.array(col, type=field.type))
+            else:
+                chunks.append(pa.DictionaryArray.from_arrays(pa.array(col, type=pa.int32()),
+                                                             pa.array(list(codes), type=field.type)))
+            col.clear()
+        self._sealed += n
+
+    def _decode(self, table: pa.Table) -> pa.Table:
+        return pa.Table.from_arrays(
+            [pa.chunked_array([c.dictionary_decode() if pa.types.is_dictionary(c.type) else c for c in column.chunks],
+                              type=field.type) for field, column in zip(self.schema, table.columns)],
+            schema=self.schema,
+        )
+
+    def to_table(self, decode: bool = True) -> pa.Table:
+        """All buffered rows; with decode=False interned columns stay dictionary-encoded."""
+        self._seal()
+        columns = []
+        for field, chunks in zip(self.schema, self._chunks):
+            if len({c.type for c in chunks}) > 1:  # interned chunks next to plain ones
+                chunks = [c.dictionary_decode() if pa.types.is_dictionary(c.type) else c for c in chunks]
+            columns.append(pa.chunked_array(chunks, type=chunks[0].type if chunks else field.type))
+        if not decode:
+            return pa.Table.from_arrays(columns, names=self.schema.names)
+        return self._decode(pa.Table.from_arrays(columns, names=self.schema.names))
+
+    def take(self, n: int | None = None, decode: bool = True) -> pa.Table:
+        """
+        Remove and return the first n buffered rows (all rows if n is None); with decode=False
+        interned columns stay dictionary-encoded, for to_typed_table to reuse the codes.
+        """
+        table = self.to_table(decode=False)
+        if n is None or n >= table.num_rows:
+            self._chunks = [[] for _ in self.schema.names]
+            self._sealed = 0
+        else:
+            rest = table.slice(n)
+            self._chunks = [list(column.chunks) for column in rest.columns]
+            self._sealed = rest.num_rows
+            table = table.slice(0, n)
+        return self._decode(table) if decode else table
+
+
+class BlockResult(NamedTuple):
+    """
+    What process_block sends back for one block:
+      table: the kept games as a columnar batch (pyarrow Table with raw_schema(extra_columns)), in game order
+      sizes: UTF-8 size of each kept game plus any skipped games just before it
+      starts: offset of each kept game from the start of the block
+      row_bytes: _row_nbytes of each kept row
+      skips: (kept rows before it, reason) for every skipped game
+      tail_bytes: size of skipped games after the last kept one
+      times: seconds per stage in this worker (see _extract; "row" includes the columnar buffer)
+      intern_stats: ColumnBuffer.intern_stats() of the block; table keeps the interned columns
+                    dictionary-encoded, which also makes it smaller to send back
+    """
+
+    table: pa.Table
+    sizes: list[int]
+    starts: list[int]
+    row_bytes: list[int]
+    skips: list[tuple[int, str]]
+    tail_bytes: int
+    times: Counter
+    intern_stats: dict[str, tuple[int, int]]
+
+    def head(self, n: int) -> BlockResult:
+        """The first n kept games, ending right after the last of them (for --sample-games)."""
+        return BlockResult(self.table.slice(0, n), self.sizes[:n], self.starts[:n], self.row_bytes[:n],
+                           [(pos, reason) for pos, reason in self.skips if pos < n], 0, self.times,
+                           self.intern_stats)
+
+
+def process_block(block: str | bytes, fast_scan: bool = False, header_filter: HeaderFilter | None = None,
+                  extra_columns: tuple[str, ...] = (), intern: tuple[str, ...] = INTERN_FIELDS) -> BlockResult:
+    """Worker task: parse every game in a block of PGN text or undecoded bytes (see BlockResult)."""
+    times: Counter = Counter()
+    buf = ColumnBuffer(raw_schema(extra_columns), intern)
+    sizes: list[int] = []
+    starts: list[int] = []
+    row_bytes: list[int] = []
+    skips: list[tuple[int, str]] = []
+    carry = pos = 0
+    games = iter_raw_game_bytes(block) if isinstance(block, bytes) else iter_raw_games(io.StringIO(block))
+    for i, raw in enumerate(games):
+        nbytes = _nbytes(raw)
+        row, reason = _extract(raw, i, fast_scan, header_filter, times, extra_columns)
+        if row is None:
+            skips.append((len(sizes), reason))
+            carry += nbytes
+            pos += nbytes
+            continue
+        t0 = time.perf_counter()
+        buf.append(row)
+        times["row"] += time.perf_counter() - t0
+        sizes.append(nbytes + carry)
+        starts.append(pos)
+        row_bytes.append(_row_nbytes(row))
+        carry = 0
+        pos += nbytes
+    t0 = time.perf_counter()
+    table = buf.to_table(decode=False)
+    times["row"] += time.perf_counter() - t0
+    return BlockResult(table, sizes, starts, row_bytes, skips, carry, times, buf.intern_stats())
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """A pool of `workers` parse processes started with POOL_START_METHOD (the caller's threads are not forked)."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+
+
+def _iter_parallel_batches(text, fast_scan: bool, header_filter: HeaderFilter | None, workers: int,
+                           block_chars: int, extra_columns: tuple[str, ...] = (),
+                           intern: tuple[str, ...] = INTERN_FIELDS,
+                           pool: ProcessPoolExecutor | None = None) -> Iterator[tuple]:
+    """
+    Fan blocks out to a process pool and yield the columnar batches back in input order.
+    pool: a pool shared with other inputs (see stream_many), left running; by default one of
+          `workers` processes (see process_pool) is created for this input. Either way at most workers * 2 of this
+          input's blocks are in flight, so inputs sharing a pool get about equal shares of it.
+    """
+    max_in_flight = workers * 2
+    own_pool = pool is None
+    if own_pool:
+        pool = process_pool(workers)
+    pending = deque()
+    try:
+        for block in iter_game_blocks(text, block_chars):
+            pending.append(pool.submit(process_block, block, fast_scan, header_filter, extra_columns, intern))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if own_pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+        else:
+            for future in pending:
+                future.cancel()
+
+
+def _parse_ints(col: pa.ChunkedArray, type_: pa.DataType) -> pa.ChunkedArray:
+    """Header strings like "1500" / "+7" / "-12" to ints; "", "?" and other non-numbers become null."""
+    col = pc.replace_substring_regex(col, r"^\+", "")
+    return pc.cast(pc.if_else(pc.match_substring_regex(col, r"^-?\d+$"), col, pa.scalar(None, pa.string())), type_)
+
+
+def _decoded(col: pa.ChunkedArray) -> pa.ChunkedArray:
+    """col with any dictionary-encoded (interned) chunks decoded."""
+    if not pa.types.is_dictionary(col.type):
+        return col
+    return pa.chunked_array([c.dictionary_decode() for c in col.chunks], type=col.type.value_type)
+
+
+def _dictionary_encoded(col: pa.ChunkedArray) -> pa.ChunkedArray:
+    """
+    pc.dictionary_encode(col), reusing the codes when col is already dictionary-encoded (the
+    interned columns of a ColumnBuffer): the chunks' dictionaries are unified and pruned to the
+    values in use, in order of first appearance, so only int codes are hashed, not strings.
+    """
+    if not pa.types.is_dictionary(col.type):
+        return pc.dictionary_encode(col)
+    if col.num_chunks == 0:
+        return col
+    unified = col.unify_dictionaries()
+    dictionary = unified.chunk(0).dictionary
+    indices = pa.chunked_array([c.indices for c in unified.chunks], type=col.type.index_type)
+    used = pc.drop_null(pc.unique(indices))
+    return pa.chunked_array([pa.DictionaryArray.from_arrays(pc.index_in(indices, value_set=used).combine_chunks(),
+                                                            dictionary.take(used))])
+
+
+def to_typed_table(table: pa.Table) -> pa.Table:
+    """
+    Convert a RAW_SCHEMA table to TYPED_SCHEMA with vectorised pyarrow compute:
+    Elo/rating diffs to int16, UTCDate + UTCTime to a timestamp, TimeControl split into
+    initial/increment seconds, and the low-cardinality header columns dictionary-encoded.
+    Interned columns may come in dictionary-encoded (ColumnBuffer.take(decode=False)); their
+    codes are reused (see _dictionary_encoded). EXTRA_COLUMNS are already typed and are passed
+    through after moves_san.
+    """
+    tc = pc.extract_regex(_decoded(table["timecontrol"]), r"^(?P<initial>\d+)(?:\+(?P<increment>\d+))?$")
+    stamp = pc.binary_join_element_wise(_decoded(table["utc_date"]), table["utc_time"], " ")
+    columns = {
+        "game_id": table["game_id"],
+        "game_datetime": pc.strptime(stamp, format="%Y.%m.%d %H:%M:%S", unit="s", error_is_null=True),
+        "white": table["white"],
+        "black": table["black"],
+        "white_elo": _parse_ints(table["white_elo"], pa.int16()),
+        "black_elo": _parse_ints(table["black_elo"], pa.int16()),
+        "white_rating_diff": _parse_ints(table["white_rating_diff"], pa.int16()),
+        "black_rating_diff": _parse_ints(table["black_rating_diff"], pa.int16()),
+        "white_title": _dictionary_encoded(table["white_title"]),
+        "black_title": _dictionary_encoded(table["black_title"]),
+        "result": _dictionary_encoded(table["result"]),
+        "termination": _dictionary_encoded(table["termination"]),
+        "initial_time_seconds": _parse_ints(pc.struct_field(tc, "initial"), pa.int32()),
+        "increment_seconds": _parse_ints(pc.struct_field(tc, "increment"), pa.int32()),
+        "opening": _dictionary_encoded(table["opening"]),
+        "eco": _dictionary_encoded(table["eco"]),
+        "event": _dictionary_encoded(table["event"]),
+        "moves_san": table["moves_san"],
+    }
+    schema = typed_schema(name for name in table.column_names if name in EXTRA_COLUMNS)
+    columns.update((name, table[name]) for name in schema.names[len(TYPED_SCHEMA):])
+    return pa.Table.from_arrays([pc.cast(columns[field.name], field.type) for field in schema], schema=schema)
+
+
+def typed_schema(extra_columns: Iterable[str] = ()) -> pa.Schema:
+    """TYPED_SCHEMA followed by the requested EXTRA_COLUMNS, as in raw_schema."""
+    return pa.schema(list(TYPED_SCHEMA) + list(raw_schema(extra_columns))[len(RAW_SCHEMA):])
+
+
+class ChunkFileWriter:
+    """Write every flushed chunk to its own chunk_XXXX.parquet (the default layout)."""
+
+    def __init__(self, out_dir: Path, start: int = 0) -> None:
+        self.out_dir = out_dir
+        self.files = start
+        self.last_file: str | None = None
+
+    def write(self, table: pa.Table) -> None:
+        fname = self.out_dir / f"chunk_{self.files:0{FNAME_PAD}d}.parquet"
+        try:
+            pq.write_table(table, fname, compression=compression)
+        except Exception:
+            logger.exception("Failed writing parquet %s", fname)
+            raise
+        logger.info("Wrote %d games to %s", table.num_rows, fname)
+        self.last_file = fname.name
+        self.files += 1
+
+    def close(self) -> None:
+        pass
+
+
+class RollingParquetWriter:
+    """
+    Append flushed chunks to long-lived pyarrow ParquetWriters.
+
+    Rows are written in row groups of exactly row_group_rows (only the last group of the run can
+    be shorter); rows left over from a flush wait for the next one. Once the current file has
+    reached target_file_bytes, the next row group starts a new part_XXXX.parquet.
+    """
+
+    def __init__(self, out_dir: Path, schema: pa.Schema, row_group_rows: int = DEFAULT_ROW_GROUP_ROWS,
+                 target_file_bytes: int = DEFAULT_TARGET_FILE_MB * 1024 * 1024) -> None:
+        self.out_dir = out_dir
+        self.schema = schema
+        self.row_group_rows = row_group_rows
+        self.target_file_bytes = target_file_bytes
+        self.files = 0
+        self._pending: list[pa.Table] = []
+        self._pending_rows = 0
+        self._fh = None
+        self._writer: pq.ParquetWriter | None = None
+        self._fname: Path | None = None
+        self._file_rows = 0
+
+    def _open(self) -> None:
+        self._fname = self.out_dir / f"part_{self.files:0{FNAME_PAD}d}.parquet"
+        self._fh = open(self._fname, "wb")
+        self._writer = pq.ParquetWriter(self._fh, self.schema, compression=compression)
+        self._file_rows = 0
+        self.files += 1
+
+    def _close_file(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._fh.close()
+        logger.info("Wrote %d games to %s", self._file_rows, self._fname)
+        self._writer = self._fh = None
+
+    def _write_row_group(self, table: pa.Table) -> None:
+        if self._writer is None:
+            self._open()
+        try:
+            self._writer.write_table(table, row_group_size=table.num_rows)
+        except Exception:
+            logger.exception("Failed writing parquet %s", self._fname)
+            raise
+        self._file_rows += table.num_rows
+        if self._fh.tell() >= self.target_file_bytes:
+            self._close_file()
+
+    def write(self, table: pa.Table) -> None:
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows < self.row_group_rows:
+            return
+        pending = pa.concat_tables(self._pending)
+        start = 0
+        while pending.num_rows - start >= self.row_group_rows:
+            self._write_row_group(pending.slice(start, self.row_group_rows))
+            start += self.row_group_rows
+        rest = pending.slice(start)
+        self._pending = [rest] if rest.num_rows else []
+        self._pending_rows = rest.num_rows
+
+    def close(self) -> None:
+        if self._pending_rows:
+            self._write_row_group(pa.concat_tables(self._pending))
+            self._pending, self._pending_rows = [], 0
+        self._close_file()
+
+
+class DuckDBTableWriter:
+    """
+    Append flushed chunks to a table in a persistent DuckDB database (--output-mode duckdb).
+
+    The table is replaced when the writer opens and created from `schema` on the first write;
+    every flush is then inserted from Arrow in its own transaction, so a crash leaves only whole
+    chunks behind. DuckDB stores the rows in its own compressed format with zonemaps, and clean.py
+    --db can run on the same file.
+    """
+
+    def __init__(self, db_path: Path, table: str, schema: pa.Schema) -> None:
+        import duckdb
+
+        self.db_path = db_path
+        self.table = '"' + table.replace('"', '""') + '"'
+        self.schema = schema
+        self.files = 0  # no parquet files
+        self.rows = 0
+        self._con = duckdb.connect(str(db_path))
+        self._con.execute(f"DROP TABLE IF EXISTS {self.table}")
+        self._created = False
+
+    def write(self, table: pa.Table) -> None:
+        con = self._con
+        con.register("_batch", table)
+        try:
+            con.begin()
+            if not self._created:
+                con.execute(f"CREATE TABLE {self.table} AS SELECT * FROM _batch LIMIT 0")
+                self._created = True
+            con.execute(f"INSERT INTO {self.table} SELECT * FROM _batch")
+            con.commit()
+        except Exception:
+            con.rollback()
+            logger.exception("Failed appending to %s in %s", self.table, self.db_path)
+            raise
+        finally:
+            con.unregister("_batch")
+        self.rows += table.num_rows
+
+    def close(self) -> None:
+        if not self._created:
+            self.write(self.schema.empty_table())
+        self._con.close()
+        logger.info("Appended %d games to %s in %s", self.rows, self.table, self.db_path)
+
+
+class _ConvertingWriter:
+    """Apply `convert` to every flushed table before handing it to the wrapped writer."""
+
+    def __init__(self, writer, convert) -> None:
+        self.writer = writer
+        self.convert = convert
+
+    @property
+    def files(self) -> int:
+        return self.writer.files
+
+    @property
+    def last_file(self) -> str | None:
+        return self.writer.last_file
+
+    def write(self, table: pa.Table) -> None:
+        self.writer.write(self.convert(table))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class GameIndexWriter:
+    """
+    Build out_dir/game_index.parquet for --index.
+
+    Each flush writes its rows (INDEX_SCHEMA) to game_index_parts/part_XXXX.parquet, numbered
+    like the chunks so a resumed run keeps the parts of the chunks it keeps. finish() sorts all
+    parts by game_id into one file of small row groups, whose min/max statistics let GameIndex
+    read a single row group per lookup, and removes the parts.
+    """
+
+    def __init__(self, out_dir: Path, source: Path, start: int = 0) -> None:
+        self.path = out_dir / INDEX_NAME
+        self.parts_dir = out_dir / INDEX_PARTS_DIR
+        self.source = source
+        self.parts = start
+        self.parts_dir.mkdir(exist_ok=True)
+        for stale in self.parts_dir.glob("part_*.parquet"):
+            if int(stale.stem.split("_")[1]) >= start:
+                stale.unlink()
+        self.path.unlink(missing_ok=True)
+
+    def write(self, game_ids: pa.ChunkedArray, starts: list[int], lengths: list[int],
+              frames: list[tuple[int, int]]) -> None:
+        table = pa.Table.from_arrays([
+            game_ids,
+            pa.array(starts, pa.int64()),
+            pa.array(lengths, pa.int32()),
+            pa.array([f[0] for f in frames], pa.int64()),
+            pa.array([f[1] for f in frames], pa.int64()),
+        ], schema=INDEX_SCHEMA)
+        pq.write_table(table, self.parts_dir / f"part_{self.parts:0{FNAME_PAD}d}.parquet", compression=compression)
+        self.parts += 1
+
+    def finish(self) -> None:
+        parts = sorted(self.parts_dir.glob("part_*.parquet"))
+        table = pa.concat_tables([pq.read_table(f, schema=INDEX_SCHEMA) for f in parts]) if parts \
+            else INDEX_SCHEMA.empty_table()
+        table = table.filter(pc.is_valid(table["game_id"]))
+        table = table.take(pc.sort_indices(table, [("game_id", "ascending")]))
+        table = table.replace_schema_metadata({
+            "source": self.source.name,
+            "source_bytes": str(self.source.stat().st_size),
+        })
+        tmp = self.path.with_suffix(".tmp")
+        pq.write_table(table, tmp, row_group_size=INDEX_ROW_GROUP_ROWS, compression=compression)
+        os.replace(tmp, self.path)
+        for f in parts:
+            f.unlink()
+        self.parts_dir.rmdir()
+        logger.info("Indexed %d games in %s", table.num_rows, self.path)
+
+
+class GameIndex:
+    """
+    Look up the raw PGN of a game by game_id using game_index.parquet (extract_all.py --index).
+
+    The index is sorted by game_id, so a lookup reads the footer once and then one small row
+    group; the game is then decompressed from the start of its zstd frame only. For Lichess
+    dumps that are one big frame this still means decompressing from the start of the file;
+    reframe() (or any multi-frame compressor such as pzstd / zstd --long with -B) makes the
+    frames small so lookups only decompress a few MB.
+    """
+
+    def __init__(self, index_path: str | Path, zst_path: str | Path) -> None:
+        self.zst_path = Path(zst_path)
+        self._file = pq.ParquetFile(index_path)
+        meta = self._file.schema_arrow.metadata or {}
+        expected = meta.get(b"source_bytes")
+        if expected is not None and int(expected) != self.zst_path.stat().st_size:
+            raise ValueError(f"{index_path} was built from a {int(expected)}-byte "
+                             f"{meta.get(b'source', b'?').decode()}, not {self.zst_path}")
+        md = self._file.metadata
+        col = self._file.schema_arrow.get_field_index("game_id")
+        self._groups: list[tuple[str, str]] = []
+        for i in range(md.num_row_groups):
+            stats = md.row_group(i).column(col).statistics
+            if stats is None or not stats.has_min_max:
+                raise ValueError(f"{index_path} has no game_id statistics; rebuild it with --index")
+            self._groups.append((stats.min, stats.max))
+
+    def __len__(self) -> int:
+        return self._file.metadata.num_rows
+
+    def locate(self, game_id: str) -> dict | None:
+        """The INDEX_SCHEMA row for game_id, or None if it is not indexed."""
+        i = bisect.bisect_left(self._groups, game_id, key=lambda g: g[1])
+        if i == len(self._groups) or self._groups[i][0] > game_id:
+            return None
+        group = self._file.read_row_group(i)
+        hit = group.filter(pc.equal(group["game_id"], game_id))
+        return hit.to_pylist()[0] if hit.num_rows else None
+
+    def raw_game(self, game_id: str) -> str | None:
+        """The raw PGN text of game_id as it appears in the .pgn.zst, or None if it is not indexed."""
+        entry = self.locate(game_id)
+        if entry is None:
+            return None
+        with open(self.zst_path, "rb") as fh:
+            return read_raw_game(fh, entry)
+
+
+def read_raw_game(fh, entry: dict) -> str:
+    """Decompress one game given its INDEX_SCHEMA row, starting at its zstd frame."""
+    reader = ZstdFrameReader(fh, entry["frame_offset"], entry["frame_decompressed_offset"])
+    reader.skip(entry["offset"] - entry["frame_decompressed_offset"])
+    return reader.read(entry["length"]).decode("utf-8", errors="replace")
+
+
+def reframe(src: str | Path, dst: str | Path, frame_mb: int = 16, level: int = 3) -> int:
+    """
+    Recompress src into independent zstd frames of ~frame_mb decompressed (cut at game starts),
+    so GameIndex lookups only decompress one frame. Returns the number of frames written.
+    Decompressed bytes are unchanged, so an index built on src is valid after re-running --index
+    on dst (frame columns differ, offsets do not).
+    """
+    cctx = zstd.ZstdCompressor(level=level)
+    frames = 0
+    with open_pgn_text(src, queue_depth=DEFAULT_QUEUE_DEPTH, binary=True) as text, open(dst, "wb") as out:
+        for block in iter_game_blocks(text, frame_mb * 1024 * 1024):
+            out.write(cctx.compress(block))
+            frames += 1
+    return frames
+
+
+class Manifest:
+    """
+    manifest.json next to the chunk files: one entry per written chunk with its game count, the
+    decompressed offset just past its last game, and the zstd frame (compressed offset + its
+    decompressed offset) that position lies in. It is rewritten atomically after every chunk, so
+    after a crash --resume can seek to that frame, skip to the offset and carry on with the
+    next chunk number.
+    """
+
+    def __init__(self, path: Path, source: Path, settings: dict, chunks: list[dict] | None = None,
+                 complete: bool = False) -> None:
+        self.path = path
+        self.source = str(source)
+        self.source_bytes = source.stat().st_size
+        self.settings = settings
+        self.chunks = chunks or []
+        self.complete = complete
+
+    @classmethod
+    def load(cls, path: Path, source: Path, settings: dict) -> Manifest:
+        """Load an existing manifest, checking it was written for the same input and settings."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        manifest = cls(path, source, settings, data["chunks"], data["complete"])
+        if data["source_bytes"] != manifest.source_bytes or Path(data["source"]).name != source.name:
+            raise ValueError(f"{path} was written for {data['source']}, not {source}")
+        if data["settings"] != settings:
+            raise ValueError(f"{path} was written with settings {data['settings']}, not {settings}")
+        return manifest
+
+    @property
+    def games(self) -> int:
+        return self.chunks[-1]["games_total"] if self.chunks else 0
+
+    def resume_point(self) -> tuple[int, int, int] | None:
+        """(frame_offset, frame_decompressed_offset, decompressed_offset) after the last chunk."""
+        if not self.chunks:
+            return None
+        last = self.chunks[-1]
+        return last["frame_offset"], last["frame_decompressed_offset"], last["decompressed_offset"]
+
+    @property
+    def skipped(self) -> dict[str, int]:
+        return self.chunks[-1]["skipped"] if self.chunks else {}
+
+    def add_chunk(self, fname: str, games: int, decompressed_offset: int, frame: tuple[int, int],
+                  skipped: dict[str, int]) -> None:
+        self.chunks.append({
+            "file": fname,
+            "games": games,
+            "games_total": self.games + games,
+            "decompressed_offset": decompressed_offset,
+            "frame_offset": frame[0],
+            "frame_decompressed_offset": frame[1],
+            "skipped": skipped,
+        })
+        self.save()
+
+    def finish(self) -> None:
+        self.complete = True
+        self.save()
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "source": self.source,
+                "source_bytes": self.source_bytes,
+                "settings": self.settings,
+                "complete": self.complete,
+                "chunks": self.chunks,
+            }, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+class BackgroundWrites:
+    """
+    Run chunk writes (the parquet/DuckDB write with its typed conversion, plus the index and
+    manifest bookkeeping that must follow it) in order on one background thread, so parsing goes
+    on while the previous chunk is encoded, compressed and written.
+
+    At most `depth` jobs wait in the queue besides the one running; submit() blocks until there is
+    room. The first failure is raised from the next submit() or
+    from close(), and every later job is dropped, so the manifest never lists a chunk after one
+    that failed.
+    """
+
+    def __init__(self, depth: int = DEFAULT_WRITE_QUEUE) -> None:
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name=f"{threading.current_thread().name}-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if self._error is None:
+                try:
+                    job()
+                except BaseException as exc:  # surfaced to the parsing thread
+                    self._error = exc
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, job: Callable[[], None]) -> None:
+        self._raise()
+        self._queue.put(job)  # the thread drains the queue even after a failure
+
+    def close(self, check: bool = True) -> None:
+        """Wait for the queued writes; check=False only waits (when the run is already failing)."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if check:
+            self._raise()
+
+
+class _ChunkSink:
+    """
+    Collect extracted rows (single games or worker batches) and write a chunk as soon as the
+    buffered rows reach flush_bytes (see _row_nbytes) or chunk_games rows, whichever comes first.
+    Both limits give the same chunk boundaries on every path. If max_rss_bytes is set and the
+    process RSS reaches it, everything buffered is flushed early; those boundaries depend on
+    timing, but the manifest records them so --resume still works. RSS can stay above the
+    ceiling after a flush (freed memory the allocator keeps, chunks still with the writer
+    thread), so that must not cut the output into tiny chunks: an RSS flush needs at least
+    1/RSS_MIN_FLUSH_DIVISOR of flush_bytes buffered, and the next one also needs RSS to have
+    grown by that much since the previous RSS flush.
+
+    Keeps the decompressed offset just past the last written game so every chunk can be
+    checkpointed in the manifest. Bytes of skipped games are charged to the next kept game, and
+    a skip only reaches the `skipped` counters once the chunk holding the next kept game is
+    written, so a checkpoint never counts games that a resumed run will see again.
+
+    write_queue: hand every chunk, once taken from the buffer, to a BackgroundWrites thread
+    with this many chunks queued; the manifest entry is added after the chunk is on disk.
+    0 writes synchronously.
+    decode: hand the writer plain columns; False keeps the interned ones dictionary-encoded, for
+    a writer that starts with to_typed_table.
+    """
+
+    def __init__(self, writer, chunk_games: int, text: PrefetchTextReader, manifest: Manifest | None = None,
+                 count: int = 0, offset: int = 0, skipped: dict[str, int] | None = None,
+                 flush_bytes: int | None = None, max_rss_bytes: int | None = None,
+                 index: GameIndexWriter | None = None, schema: pa.Schema = RAW_SCHEMA,
+                 intern: Iterable[str] = INTERN_FIELDS, write_queue: int = DEFAULT_WRITE_QUEUE,
+                 decode: bool = True) -> None:
+        self.writer = writer
+        self.decode = decode
+        self.writes = BackgroundWrites(write_queue) if write_queue > 0 else None
+        self.chunk_games = chunk_games
+        self.flush_bytes = flush_bytes
+        self.max_rss_bytes = max_rss_bytes
+        self._rss_min_bytes = (flush_bytes or DEFAULT_FLUSH_MB * 1024 * 1024) // RSS_MIN_FLUSH_DIVISOR
+        self._rss_rearm = max_rss_bytes  # RSS the next early flush needs
+        self.text = text
+        self.manifest = manifest
+        self.count = count
+        self.written = count
+        self.offset = offset
+        self.skipped = Counter(skipped or {})
+        self.buf = ColumnBuffer(schema, intern)
+        self.buf_bytes = 0
+        self._sizes: list[int] = []
+        self._row_bytes: list[int] = []
+        self._carry = 0
+        self._skip_events: deque[tuple[int, str]] = deque()
+        self.times: Counter = Counter()  # "row" (buffering), "write" and "write_wait" seconds, see IngestMetrics
+        self.bytes_in = 0  # decompressed bytes of every game seen, kept or skipped
+        self.index = index
+        self._starts: list[int] = []  # absolute offset and length of each buffered row, for --index
+        self._lengths: list[int] = []
+
+    def skip(self, reason: str, nbytes: int) -> None:
+        self._skip_events.append((self.count, reason))
+        self._carry += nbytes
+        self.bytes_in += nbytes
+
+    def add_row(self, row: dict, nbytes: int) -> None:
+        t0 = time.perf_counter()
+        self.buf.append(row)
+        self.times["row"] += time.perf_counter() - t0
+        if self.index is not None:
+            self._starts.append(self.text.start_offset + self.bytes_in)
+            self._lengths.append(nbytes)
+        self.bytes_in += nbytes
+        self._sizes.append(nbytes + self._carry)
+        self._carry = 0
+        row_bytes = _row_nbytes(row)
+        self._row_bytes.append(row_bytes)
+        self.buf_bytes += row_bytes
+        self.count += 1
+        if len(self.buf) >= self.chunk_games or (self.flush_bytes and self.buf_bytes >= self.flush_bytes):
+            self._flush(len(self.buf))
+        elif self.max_rss_bytes and self.count % RSS_CHECK_ROWS == 0:
+            self._check_rss()
+
+    def add_batch(self, batch: BlockResult) -> None:
+        """Add a worker batch (see process_block)."""
+        table, sizes, row_bytes, tail_bytes = batch.table, list(batch.sizes), batch.row_bytes, batch.tail_bytes
+        if self.index is not None:
+            base = self.text.start_offset + self.bytes_in
+            end = base
+            for start, size in zip(batch.starts, sizes):
+                end += size
+                self._starts.append(base + start)
+                self._lengths.append(end - base - start)
+        self.bytes_in += sum(sizes) + tail_bytes
+        self._skip_events.extend((self.count + pos, reason) for pos, reason in batch.skips)
+        if sizes:
+            sizes[0] += self._carry
+            self._carry = 0
+        self._carry += tail_bytes
+        self.buf.extend(table, batch.intern_stats)
+        self._sizes.extend(sizes)
+        self._row_bytes.extend(row_bytes)
+        self.buf_bytes += sum(row_bytes)
+        self.count += table.num_rows
+        while True:
+            n = self._flush_point()
+            if n is None:
+                break
+            self._flush(n)
+        if self.max_rss_bytes:
+            self._check_rss()
+
+    def _flush_point(self) -> int | None:
+        """Rows to flush so that chunks end where the row-at-a-time path would end them."""
+        n = self.chunk_games if len(self.buf) >= self.chunk_games else None
+        if self.flush_bytes and self.buf_bytes >= self.flush_bytes:
+            total = 0
+            for i, b in enumerate(self._row_bytes):
+                total += b
+                if total >= self.flush_bytes:
+                    n = i + 1 if n is None else min(n, i + 1)
+                    break
+        return n
+
+    def _check_rss(self) -> None:
+        rss = current_rss_bytes()
+        if rss is None or rss < self._rss_rearm or self.buf_bytes < self._rss_min_bytes:
+            return
+        logger.warning("RSS %.0f MB reached the %.0f MB ceiling; flushing %d buffered games early",
+                       rss / 2**20, self.max_rss_bytes / 2**20, len(self.buf))
+        self._flush(len(self.buf))
+        rss = current_rss_bytes() or rss
+        self._rss_rearm = max(self.max_rss_bytes, rss + self._rss_min_bytes)
+
+    def _count_skips(self, before: int) -> None:
+        events = self._skip_events
+        while events and events[0][0] < before:
+            self.skipped[events.popleft()[1]] += 1
+
+    def _flush(self, n: int) -> None:
+        t0 = time.perf_counter()
+        table = self.buf.take(n, decode=self.decode)
+        index_rows = None
+        if self.index is not None:
+            starts = self._starts[:n]
+            index_rows = starts, self._lengths[:n], [self.text.frame_at(s) for s in starts]
+            del self._starts[:n], self._lengths[:n]
+        self.offset += sum(self._sizes[:n])
+        del self._sizes[:n]
+        self.buf_bytes -= sum(self._row_bytes[:n])
+        del self._row_bytes[:n]
+        self.written += n
+        self._count_skips(self.written)
+        checkpoint = self.offset, self.text.frame_at(self.offset), dict(self.skipped)
+        take_seconds = time.perf_counter() - t0
+
+        def write() -> None:
+            # runs on the writer thread, which is then the only one adding to times["write"]
+            t1 = time.perf_counter()
+            self.writer.write(table)
+            if index_rows is not None:
+                self.index.write(table["game_id"], *index_rows)
+            self.times["write"] += take_seconds + time.perf_counter() - t1
+            if self.manifest is not None:
+                offset, frame, skipped = checkpoint
+                self.manifest.add_chunk(self.writer.last_file, n, offset, frame, skipped)
+
+        if self.writes is None:
+            write()
+        else:
+            t0 = time.perf_counter()
+            self.writes.submit(write)
+            self.times["write_wait"] += time.perf_counter() - t0
+
+    @property
+    def queued_writes(self) -> int:
+        return self.writes.queued if self.writes is not None else 0
+
+    def close(self) -> None:
+        """Final flush; waits for the background writes, counts the remaining skips and marks the manifest complete."""
+        if len(self.buf):
+            self._flush(len(self.buf))
+        if self.writes is not None:
+            self.writes.close()
+        self._count_skips(self.count + 1)
+        if self.index is not None:
+            self.index.finish()
+        if self.manifest is not None:
+            self.manifest.finish()
+
+    def abort(self) -> None:
+        """Let the writes already handed off finish (their manifest entries stay valid for --resume)."""
+        if self.writes is not None:
+            self.writes.close(check=False)
+
+
+class IngestMetrics:
+    """
+    Periodic ingest metrics, written as JSON lines.
+
+    Each record has elapsed seconds, games (kept) and games_seen (kept + skipped), games_per_s,
+    compressed/decompressed MB and MB/s, cumulative seconds per stage, buffered games/bytes,
+    read-ahead buffers queued and RSS. Stages: decompress (zstd + UTF-8 decode, in the prefetch
+    thread unless --queue-depth 0), headers, san, row (see _extract), write (parquet writes,
+    including the typed conversion; on the writer thread unless --write-queue 0) and write_wait
+    (parsing blocked on a full write queue). queued_writes is the chunks waiting for the writer
+    thread. With --workers the parse stages are summed over the worker
+    processes, so they can exceed wall time. intern_hit_rate is the share of interned header
+    values that were already in their column's dictionary (see ColumnBuffer). The last record has
+    "final": true.
+    """
+
+    def __init__(self, path: str | Path | None, text: PrefetchTextReader, sink: _ChunkSink,
+                 interval: float = DEFAULT_METRICS_INTERVAL) -> None:
+        self.text = text
+        self.sink = sink
+        self.interval = interval
+        self.times: Counter = Counter()  # stages timed outside the sink (the parse loop / workers)
+        self.games_seen = 0
+        self._fh = open(path, "a", encoding="utf-8") if path else None
+        self._count0 = sink.count
+        self._compressed0 = text.compressed_bytes
+        self._t0 = self._last = time.perf_counter()
+
+    def record(self, final: bool = False) -> dict:
+        sink, text = self.sink, self.text
+        elapsed = time.perf_counter() - self._t0
+        per_s = 1 / elapsed if elapsed > 0 else 0.0
+        games = sink.count - self._count0
+        compressed_mb = (text.compressed_bytes - self._compressed0) / 2**20
+        decompressed_mb = sink.bytes_in / 2**20
+        stages = {"decompress": text.decompress_seconds, **self.times, **sink.times}
+        rss = current_rss_bytes()
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "elapsed_s": round(elapsed, 3),
+            "games": games,
+            "games_seen": self.games_seen,
+            "games_per_s": round(games * per_s, 1),
+            "compressed_mb": round(compressed_mb, 3),
+            "compressed_mb_per_s": round(compressed_mb * per_s, 3),
+            "decompressed_mb": round(decompressed_mb, 3),
+            "decompressed_mb_per_s": round(decompressed_mb * per_s, 3),
+            "stage_s": {k: round(stages.get(k, 0.0), 3) for k in ("decompress", "headers", "san", "row", "write", "write_wait")},
+            "buffered_games": len(sink.buf),
+            "buffered_mb": round(sink.buf_bytes / 2**20, 3),
+            "queued_buffers": text.queued_buffers,
+            "queued_writes": sink.queued_writes,
+            "rss_mb": round(rss / 2**20, 1) if rss is not None else None,
+            "intern_hit_rate": {name: round(1 - misses / lookups, 4) if lookups else None
+                                for name, (lookups, misses) in sink.buf.intern_stats().items()},
+            "final": final,
+        }
+
+    def _emit(self, final: bool = False) -> dict:
+        rec = self.record(final)
+        if self._fh is not None:
+            self._fh.write(json.dumps(rec) + "\n")
+            self._fh.flush()
+        return rec
+
+    def tick(self) -> None:
+        """Emit a record if interval seconds have passed since the last one."""
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._emit()
+
+    def close(self) -> dict:
+        """Emit and log the end-of-run summary."""
+        rec = self._emit(final=True)
+        if self._fh is not None:
+            self._fh.close()
+        logger.info("Ingest: %d games in %.1fs (%.0f games/s, %.1f MB/s compressed, %.1f MB/s decompressed); "
+                    "stage seconds %s", rec["games"], rec["elapsed_s"], rec["games_per_s"],
+                    rec["compressed_mb_per_s"], rec["decompressed_mb_per_s"], rec["stage_s"])
+        if rec["intern_hit_rate"]:
+            logger.info("Interned header hit rates: %s", rec["intern_hit_rate"])
+        return rec
+
+
 def stream_to_parquet(
     zst_path: str | Path,
     out_dir: str | Path,
     chunk_games: int = DEFAULT_CHUNK_GAMES,
     sample_games: int | None = None,
+    fast_scan: bool = False,
+    workers: int = 1,
+    block_mb: int = DEFAULT_BLOCK_MB,
+    queue_depth: int = DEFAULT_QUEUE_DEPTH,
+    buffer_mb: int = DEFAULT_BUFFER_MB,
+    output_mode: str = "chunks",
+    row_group_rows: int = DEFAULT_ROW_GROUP_ROWS,
+    target_file_mb: int = DEFAULT_TARGET_FILE_MB,
+    schema: str = "raw",
+    resume: bool = False,
+    skip_titles: Iterable[str] = DEFAULT_SKIP_TITLES,
+    skip_terminations: Iterable[str] = DEFAULT_SKIP_TERMINATIONS,
+    where: Iterable[str] = (),
+    sample_rate: float | None = None,
+    flush_mb: int | None = DEFAULT_FLUSH_MB,
+    max_rss_mb: int | None = None,
+    metrics_path: str | Path | None = None,
+    metrics_interval: float = DEFAULT_METRICS_INTERVAL,
+    index: bool = False,
+    shard: tuple[int, int] | None = None,
+    extra_columns: Iterable[str] = (),
+    intern: bool = True,
+    duckdb_path: str | Path | None = None,
+    duckdb_table: str = DEFAULT_DUCKDB_TABLE,
+    transform: Callable[[pa.Table], pa.Table] | None = None,
+    pool: ProcessPoolExecutor | None = None,
+    write_queue: int = DEFAULT_WRITE_QUEUE,
 ) -> None:
     """
     Stream a .pgn.zst and write partitioned parquet files to out_dir.
+
+    fast_scan: parse headers/movetext from the raw text instead of chess.pgn.read_game.
+    workers: if > 1, parse game-aligned blocks of ~block_mb in a process pool.
+             Chunk files and row order are the same as the serial run.
+    queue_depth/buffer_mb: decompression read-ahead (see open_pgn_text); 0 decompresses inline.
+    output_mode: "chunks" writes one chunk_XXXX.parquet per flush; "stream" appends every flush to
+                 part_XXXX.parquet files in row groups of row_group_rows, rolling over at ~target_file_mb;
+                 "duckdb" appends every flush to a DuckDB table (duckdb_path/duckdb_table).
+    schema: "raw" keeps every header as a string (FIELDS); "typed" writes TYPED_SCHEMA (see to_typed_table).
+    resume: continue after the last chunk recorded in out_dir/manifest.json (chunks mode only).
+            The remaining chunks are identical to those of an uninterrupted run.
+    skip_titles/skip_terminations: games with a WhiteTitle/BlackTitle or Termination in these are
+            dropped from the headers alone (defaults: clean.py's rules). Per-reason counts go to
+            out_dir/skipped.json.
+    where: --where expressions (see module docstring); games not matching all of them are skipped
+            the same way.
+    sample_rate: keep only games with in_sample(game_id, sample_rate), decided from the Site
+            header before the movetext is parsed; counted as "sample" in skipped.json.
+    flush_mb: flush once the buffered rows hold ~flush_mb of data; chunk_games stays a cap on rows.
+    max_rss_mb: also flush early whenever the process RSS reaches this many MB.
+    metrics_path: append IngestMetrics JSON lines here every metrics_interval seconds
+                  (default out_dir/metrics.jsonl); the summary is also logged at the end.
+    index: also write out_dir/game_index.parquet mapping every written game_id to its frame and
+           decompressed offset in zst_path (see GameIndex / lookup_game.py).
+    shard: (i, N) to process only the i-th of N ranges of zst_path (see shard_bounds; chunks mode
+           only). Each shard writes its own out_dir; merge_shards combines them.
+    duckdb_path/duckdb_table: with output_mode "duckdb", the database (default out_dir/games.duckdb)
+           and table every flush is appended to (see DuckDBTableWriter).
+    extra_columns: names from EXTRA_COLUMNS (e.g. "clocks") to add after moves_san, read from the
+           movetext comments in the same pass as the moves.
+    intern: hold the INTERN_FIELDS columns of buffered rows as dictionary codes (see ColumnBuffer);
+           the written files are the same either way.
+    transform: applied to every flushed table (after the typed conversion) before it is written,
+           e.g. pipeline.py's clean + end-reason step; its `name` attribute (or class name) goes
+           into the manifest settings. Not with output_mode "stream", whose schema is fixed up front.
+    pool: parse in this (shared) process pool of `workers` processes instead of one of its own,
+          even with workers == 1 (see stream_many).
+    write_queue: write chunks on a background thread while parsing continues, with at most this
+          many flushed chunks waiting besides the one being written (see BackgroundWrites); a
+          failed write still fails the run. 0 writes each chunk before parsing resumes.
     """
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"output_mode must be one of {OUTPUT_MODES}, got {output_mode!r}")
+    if schema not in SCHEMAS:
+        raise ValueError(f"schema must be one of {SCHEMAS}, got {schema!r}")
+    if transform is not None and output_mode == "stream":
+        raise ValueError("transform needs output_mode='chunks' or 'duckdb'")
+    in_schema = raw_schema(extra_columns)
+    extra_columns = tuple(in_schema.names[len(RAW_SCHEMA):])
+    intern_fields = INTERN_FIELDS if intern else ()
     zst_path = Path(zst_path)
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
 
     
-    ctx = zstd.ZstdDecompressor()
-    buf: list[dict[str, str]] = []
-    file_idx = 0
-    count = 0
+    header_filter = HeaderFilter(skip_titles, skip_terminations, where, sample_rate)
+    manifest = None
+    bounds = None
+    if shard is not None:
+        if output_mode != "chunks":
+            raise ValueError("shard needs output_mode='chunks'")
+        bounds = shard_bounds(zst_path, *shard)
+    if output_mode == "chunks":
+        manifest_path = out_dir / MANIFEST_NAME
+        settings = {"chunk_games": chunk_games, "flush_mb": flush_mb, "fast_scan": fast_scan, "schema": schema,
+                    "sample_games": sample_games, "filter": header_filter.describe(), "index": index, "extra_columns": list(extra_columns),
+                    "transform": getattr(transform, "name", type(transform).__name__) if transform else None}
+        if bounds is not None:
+            settings["shard"] = bounds
+        if resume and manifest_path.exists():
+            manifest = Manifest.load(manifest_path, zst_path, settings)
+            if manifest.complete:
+                logger.info("%s is complete (%d games in %d chunks); nothing to resume.",
+                            manifest_path, manifest.games, len(manifest.chunks))
+                return
+            logger.info("Resuming after %d chunks / %d games", len(manifest.chunks), manifest.games)
+        else:
+            if resume:
+                logger.warning("No manifest in %s; starting from the beginning.", out_dir)
+            manifest = Manifest(manifest_path, zst_path, settings)
+    elif resume:
+        raise ValueError("resume needs output_mode='chunks'")
 
-    logger.info("Starting stream: %s -> %s (chunk=%d)", zst_path, out_dir, chunk_games)
+    out_schema, convert = (typed_schema(extra_columns), to_typed_table) if schema == "typed" else (in_schema, None)
+    if output_mode == "stream":
+        writer = RollingParquetWriter(out_dir, out_schema, row_group_rows, target_file_mb * 1024 * 1024)
+    elif output_mode == "duckdb":
+        writer = DuckDBTableWriter(Path(duckdb_path) if duckdb_path else out_dir / DUCKDB_NAME, duckdb_table,
+                                   out_schema)
+    else:
+        writer = ChunkFileWriter(out_dir, start=len(manifest.chunks))
+    if transform is not None:
+        writer = _ConvertingWriter(writer, transform)
+    if convert is not None:
+        writer = _ConvertingWriter(writer, convert)
+    start = manifest.resume_point() if manifest is not None else None
+    resync = False
+    if start is None and bounds is not None and bounds["start"] > 0:
+        start = bounds["frame_offset"], bounds["frame_decompressed_offset"], bounds["start"]
+        resync = True
+    index_writer = GameIndexWriter(out_dir, zst_path, start=len(manifest.chunks) if manifest is not None else 0) \
+        if index else None
 
-    with open(zst_path, "rb") as fh, ctx.stream_reader(fh) as reader, \
-         io.TextIOWrapper(reader, encoding="utf-8", errors="replace", newline="\n") as text:
-        process = process_game
-        while True:
-            game = chess.pgn.read_game(text)
-            if game is None:
-                break
-            row = process(game, count)
-            buf.append(row)
-            count += 1
+    if max_rss_mb and current_rss_bytes() is None:
+        logger.warning("Cannot read process RSS on this platform (install psutil); --max-rss-mb is ignored.")
+    logger.info("Starting stream: %s -> %s (chunk=%d, flush_mb=%s, fast_scan=%s, workers=%d, output=%s, schema=%s)",
+                zst_path, out_dir, chunk_games, flush_mb, fast_scan, workers, output_mode, schema)
 
-            if count % 10000 == 0:
-                logger.info("Processed %d games... buffer size %d", count, len(buf))
+    if bounds is not None:
+        logger.info("Shard %d/%d: decompressed range [%d, %s)", bounds["index"], bounds["count"], bounds["start"],
+                    bounds["stop"] if bounds["stop"] is not None else "end")
 
-            if len(buf) >= chunk_games:
-                df = pd.DataFrame(buf)
-                fname = out_dir / f"chunk_{file_idx:0{FNAME_PAD}d}.parquet"
-                try:
-                    df.to_parquet(fname, index=False, compression=compression, engine=parquet_engine)
-                except Exception:
-                    logger.exception("Failed writing parquet %s", fname)
-                    raise
-                logger.info("Wrote %d games to %s", len(df), fname)
-                file_idx += 1
-                buf = []
-
-            if sample_games and count >= sample_games:
-                logger.info("Reached sample_games limit (%d). Stopping early.", sample_games)
-                break
-
-    # final flush
-    if buf:
-        df = pd.DataFrame(buf)
-        fname = out_dir / f"chunk_{file_idx:0{FNAME_PAD}d}.parquet"
+    # --fast-scan reads headers and movetext from undecoded bytes; the full parse needs text
+    with open_pgn_text(zst_path, queue_depth, buffer_mb, start, resync, bounds and bounds["stop"],
+                       binary=fast_scan) as text:
+        sink = _ChunkSink(writer, chunk_games, text, manifest,
+                          count=manifest.games if manifest is not None else 0, offset=text.start_offset,
+                          skipped=manifest.skipped if manifest is not None else None,
+                          flush_bytes=flush_mb * 1024 * 1024 if flush_mb else None,
+                          max_rss_bytes=max_rss_mb * 1024 * 1024 if max_rss_mb else None,
+                          index=index_writer, schema=in_schema, intern=intern_fields, write_queue=write_queue,
+                          decode=convert is None)
+        metrics = IngestMetrics(metrics_path or out_dir / METRICS_NAME, text, sink, metrics_interval)
         try:
-            df.to_parquet(fname, index=False, compression=compression, engine=parquet_engine)
-        except Exception:
-            logger.exception("Failed writing parquet %s", fname)
-            raise
-        logger.info("Wrote %d games to %s", len(df), fname)
-        file_idx += 1
+            if workers > 1 or pool is not None:
+                _stream_parallel(text, sink, metrics, sample_games, fast_scan, header_filter, workers,
+                                 block_mb * 1024 * 1024, extra_columns, intern_fields, pool)
+            else:
+                _stream_serial(text, sink, metrics, sample_games, fast_scan, header_filter, extra_columns)
+            sink.close()
+        finally:
+            sink.abort()
+            writer.close()
+        metrics.close()
 
-    logger.info("Done. Games written (approx): %d ; parquet files: %d", count, file_idx)
+    with open(out_dir / SKIPPED_NAME, "w", encoding="utf-8") as f:
+        json.dump({"games_written": sink.count, "skipped": dict(sink.skipped)}, f, indent=1)
+    logger.info("Skipped %d games by header: %s", sum(sink.skipped.values()), dict(sink.skipped))
+    logger.info("Done. Games written (approx): %d ; parquet files: %d", sink.count, writer.files)
 
 
-def main() -> None:
+def expand_inputs(patterns: Iterable[str | Path]) -> list[Path]:
+    """Input paths from paths and glob patterns (expanded here, so quoted patterns work on Windows too)."""
+    paths: list[Path] = []
+    for pattern in map(str, patterns):
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise ValueError(f"no input matches {pattern!r}")
+            paths.extend(map(Path, matches))
+        else:
+            paths.append(Path(pattern))
+    return list(dict.fromkeys(paths))
+
+
+def input_partition(zst_path: str | Path) -> str:
+    """Output partition of one input: its month (YYYY-MM) if the name has one, else the name without suffixes."""
+    name = Path(zst_path).name
+    m = _MONTH_RE.search(name)
+    return m.group(1) if m else name.split(".", 1)[0]
+
+
+def stream_many(
+    zst_paths: Iterable[str | Path],
+    out_dir: str | Path,
+    workers: int = 1,
+    files_in_flight: int = DEFAULT_FILES_IN_FLIGHT,
+    **kwargs,
+) -> list[Path]:
+    """
+    stream_to_parquet for several inputs (paths or glob patterns), each into out_dir/<partition>
+    (see input_partition; e.g. out_dir/2025-09), and return those directories.
+
+    Up to files_in_flight inputs are read at once, each in its own thread with its own
+    decompression read-ahead, and all of them parse in one shared pool of `workers` processes,
+    so one input's decompression or flush does not leave the pool idle. Every partition has its
+    own manifest, so resume=True picks up each month where it stopped and skips finished ones.
+    The first error cancels the inputs not yet started and the blocks queued in the pool, so the
+    running inputs stop at their next block, and is raised once they have.
+    kwargs: other stream_to_parquet options, applied to every input (not shard, metrics_path,
+            duckdb_path or transform, which would be shared between inputs).
+    """
+    for key in ("shard", "metrics_path", "duckdb_path", "transform"):
+        if kwargs.get(key) is not None:
+            raise ValueError(f"{key} cannot be used with several inputs")
+    paths = expand_inputs(zst_paths)
+    partitions: dict[str, Path] = {}
+    for path in paths:
+        part = input_partition(path)
+        if part in partitions:
+            raise ValueError(f"{partitions[part]} and {path} would both write {part}")
+        partitions[part] = path
+    out_dir = Path(out_dir)
+    logger.info("Ingesting %d inputs into %s: %d at a time, %d parse workers", len(paths), out_dir,
+                files_in_flight, workers)
+
+    def run(part: str, path: Path) -> None:
+        threading.current_thread().name = part
+        stream_to_parquet(path, out_dir / part, workers=workers, pool=pool, **kwargs)
+
+    pool = process_pool(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=files_in_flight) as inputs:
+            futures = [inputs.submit(run, part, path) for part, path in partitions.items()]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            error = next((f.exception() for f in futures if f in done and f.exception() is not None), None)
+            if error is not None:
+                for future in futures:
+                    future.cancel()
+                # the running inputs fail on their next block (cancelled, or refused by the closed pool)
+                pool.shutdown(wait=False, cancel_futures=True)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    if error is not None:
+        raise error
+    return [out_dir / part for part in partitions]
+
+
+def merge_shards(zst_path: str | Path, out_dir: str | Path, shard_dirs: Iterable[str | Path]) -> Manifest:
+    """
+    Combine the out_dirs of a complete --shard 0/N ... N-1/N run into out_dir: chunk files are
+    moved in and renumbered in stream order, and one manifest.json / skipped.json (and
+    game_index.parquet with --index) is written as if a single run had produced them.
+    """
+    zst_path = Path(zst_path)
+    out_dir = Path(out_dir)
+    if (out_dir / MANIFEST_NAME).exists():
+        raise ValueError(f"{out_dir} already has a {MANIFEST_NAME}")
+    loaded: list[tuple[dict, Path]] = []
+    for d in map(Path, shard_dirs):
+        with open(d / MANIFEST_NAME, encoding="utf-8") as f:
+            data = json.load(f)
+        if not data["complete"]:
+            raise ValueError(f"shard {d} is not complete; finish it with --resume first")
+        if data["source_bytes"] != zst_path.stat().st_size or Path(data["source"]).name != zst_path.name:
+            raise ValueError(f"shard {d} was written for {data['source']}, not {zst_path}")
+        loaded.append((data, d))
+    if not loaded:
+        raise ValueError("no shard directories given")
+    loaded.sort(key=lambda item: item[0]["settings"].get("shard", {}).get("index", -1))
+    shards = [data["settings"].get("shard") for data, _ in loaded]
+    if any(b is None for b in shards) or [b["index"] for b in shards] != list(range(shards[0]["count"])) \
+            or any(b["count"] != len(shards) for b in shards):
+        raise ValueError(f"need exactly one directory per shard 0..N-1, got {[b and b['index'] for b in shards]}")
+    for prev, nxt in zip(shards, shards[1:]):
+        if prev["stop"] != nxt["start"]:
+            raise ValueError(f"shards {prev['index']} and {nxt['index']} do not meet")
+    settings = {k: v for k, v in loaded[0][0]["settings"].items() if k != "shard"}
+    if any({k: v for k, v in data["settings"].items() if k != "shard"} != settings for data, _ in loaded):
+        raise ValueError("shards were written with different settings")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(out_dir / MANIFEST_NAME, zst_path, settings)
+    index_writer = GameIndexWriter(out_dir, zst_path) if settings.get("index") else None
+    done = Counter()
+    for data, d in loaded:
+        for chunk in data["chunks"]:
+            fname = f"chunk_{len(manifest.chunks):0{FNAME_PAD}d}.parquet"
+            shutil.move(d / chunk["file"], out_dir / fname)
+            manifest.add_chunk(fname, chunk["games"], chunk["decompressed_offset"],
+                               (chunk["frame_offset"], chunk["frame_decompressed_offset"]),
+                               dict(done + Counter(chunk["skipped"])))
+        with open(d / SKIPPED_NAME, encoding="utf-8") as f:
+            done.update(json.load(f)["skipped"])
+        if index_writer is not None and (d / INDEX_NAME).exists():
+            shutil.copy(d / INDEX_NAME, index_writer.parts_dir / f"part_{index_writer.parts:0{FNAME_PAD}d}.parquet")
+            index_writer.parts += 1
+    if index_writer is not None:
+        index_writer.finish()
+    manifest.finish()
+    with open(out_dir / SKIPPED_NAME, "w", encoding="utf-8") as f:
+        json.dump({"games_written": manifest.games, "skipped": dict(done)}, f, indent=1)
+    logger.info("Merged %d shards: %d games in %d chunks", len(loaded), manifest.games, len(manifest.chunks))
+    return manifest
+
+
+def _stream_serial(text, sink: _ChunkSink, metrics: IngestMetrics, sample_games: int | None, fast_scan: bool,
+                   header_filter: HeaderFilter | None, extra_columns: tuple[str, ...] = ()) -> None:
+    times = metrics.times
+    if getattr(text, "binary", False):
+        games = (raw for block in iter_game_blocks(text, text.buffer_bytes) for raw in iter_raw_game_bytes(block))
+    else:
+        games = iter_raw_games(text)
+    for raw in games:
+        metrics.games_seen += 1
+        row, reason = _extract(raw, sink.count, fast_scan, header_filter, times, extra_columns)
+        if row is None:
+            sink.skip(reason, _nbytes(raw))
+            continue
+        sink.add_row(row, _nbytes(raw))
+
+        if sink.count % 1000 == 0:
+            metrics.tick()
+        if sink.count % 10000 == 0:
+            logger.info("Processed %d games... buffer size %d", sink.count, len(sink.buf))
+
+        if sample_games and sink.count >= sample_games:
+            logger.info("Reached sample_games limit (%d). Stopping early.", sample_games)
+            break
+
+
+def _stream_parallel(text, sink: _ChunkSink, metrics: IngestMetrics, sample_games: int | None, fast_scan: bool,
+                     header_filter: HeaderFilter | None, workers: int, block_chars: int,
+                     extra_columns: tuple[str, ...] = (), intern: tuple[str, ...] = INTERN_FIELDS,
+                     pool: ProcessPoolExecutor | None = None) -> None:
+    batches = _iter_parallel_batches(text, fast_scan, header_filter, workers, block_chars, extra_columns, intern,
+                                     pool)
+    for batch in batches:
+        metrics.times.update(batch.times)
+        metrics.games_seen += batch.table.num_rows + len(batch.skips)
+        if sample_games and batch.table.num_rows >= sample_games - sink.count:
+            # stop right after the last sampled game, like the serial loop
+            batch = batch.head(sample_games - sink.count)
+        sink.add_batch(batch)
+        metrics.tick()
+        logger.info("Processed %d games... buffer size %d", sink.count, len(sink.buf))
+
+        if sample_games and sink.count >= sample_games:
+            logger.info("Reached sample_games limit (%d). Stopping early.", sample_games)
+            break
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """The extract_all.py command line (also the base of pipeline.py's)."""
     p = argparse.ArgumentParser(description="Stream .pgn.zst -> partitioned parquet")
-    p.add_argument("zst_path", help="path to the .pgn.zst file")
+    p.add_argument("zst_path", nargs="+",
+                   help="path to the .pgn.zst file; several paths or a glob pattern write one <out>/<YYYY-MM> "
+                        "partition per input (see --files-in-flight)")
     p.add_argument("--out", default="out/parquet_all", help="output directory for parquet chunks")
     p.add_argument("--chunk-games", type=int, default=DEFAULT_CHUNK_GAMES,
-                   help="flush every N games (default 100000)")
+                   help="flush after at most N games (default 500000)")
+    p.add_argument("--flush-mb", type=int, default=DEFAULT_FLUSH_MB,
+                   help="flush once buffered rows hold this many MB (default 256; 0 = by game count only)")
+    p.add_argument("--max-rss-mb", type=int, default=None,
+                   help="flush early whenever the process RSS reaches this many MB")
+    p.add_argument("--metrics", default=None, metavar="PATH",
+                   help="JSON-lines throughput/stage-timing records (default <out>/metrics.jsonl)")
+    p.add_argument("--index", action="store_true",
+                   help=f"also write <out>/{INDEX_NAME} for random access to raw games (see lookup_game.py)")
+    p.add_argument("--shard", default=None, metavar="I/N",
+                   help="process only the I-th of N ranges of the input (0 <= I < N); combine with --merge-shards. "
+                        "Every zstd frame must record its content size: rewrite other inputs with "
+                        "lookup_game.py --reframe first")
+    p.add_argument("--merge-shards", nargs="+", default=None, metavar="DIR",
+                   help="instead of extracting, merge the --out directories of a complete sharded run into --out")
+    p.add_argument("--metrics-interval", type=float, default=DEFAULT_METRICS_INTERVAL,
+                   help="seconds between metrics records (default 10)")
     p.add_argument("--sample-games", type=int, default=None, help="stop after N games (for quick tests)")
+    p.add_argument("--sample-rate", type=float, default=None, metavar="P",
+                   help="keep a stable ~P share of games chosen by a hash of game_id (same games at every stage)")
+    p.add_argument("--fast-scan", action="store_true",
+                   help="read headers and SAN straight from the PGN text instead of building chess.pgn.Game objects")
+    p.add_argument("--workers", type=int, default=1, help="parse in N worker processes (default 1 = serial)")
+    p.add_argument("--files-in-flight", type=int, default=DEFAULT_FILES_IN_FLIGHT,
+                   help="with several inputs, read this many at once into one shared pool of --workers processes "
+                        f"(default {DEFAULT_FILES_IN_FLIGHT})")
+    p.add_argument("--block-mb", type=int, default=DEFAULT_BLOCK_MB,
+                   help="decompressed MB of PGN per worker task (default 4)")
+    p.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+                   help="decompressed buffers to read ahead in a background thread (0 = decompress inline)")
+    p.add_argument("--buffer-mb", type=int, default=DEFAULT_BUFFER_MB,
+                   help="decompressed MB per read-ahead buffer (default 4)")
+    p.add_argument("--output-mode", choices=OUTPUT_MODES, default="chunks",
+                   help="chunks: one parquet file per flush; stream: row groups appended to rolling part files; "
+                        "duckdb: rows appended to a table in a DuckDB database")
+    p.add_argument("--duckdb-path", default=None, metavar="PATH",
+                   help=f"database for --output-mode duckdb (default <out>/{DUCKDB_NAME})")
+    p.add_argument("--duckdb-table", default=DEFAULT_DUCKDB_TABLE,
+                   help="table for --output-mode duckdb, replaced at the start of the run (default %(default)s)")
+    p.add_argument("--write-queue", type=int, default=DEFAULT_WRITE_QUEUE,
+                   help="flushed chunks that may wait for the background writer thread while parsing goes on "
+                        f"(default {DEFAULT_WRITE_QUEUE}; 0 = write before parsing resumes)")
+    p.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_ROWS,
+                   help="rows per row group with --output-mode stream (default 131072)")
+    p.add_argument("--target-file-mb", type=int, default=DEFAULT_TARGET_FILE_MB,
+                   help="start a new part file once the current one reaches this size (default 512)")
+    p.add_argument("--schema", choices=SCHEMAS, default="raw",
+                   help="raw: all headers as strings; typed: ints/timestamp/split time control, "
+                        "dictionary-encoded low-cardinality columns")
+    p.add_argument("--extra-columns", nargs="+", choices=list(EXTRA_COLUMNS), default=[], metavar="COLUMN",
+                   help=f"also write these per-move columns, read from the movetext comments ({', '.join(EXTRA_COLUMNS)})")
+    p.add_argument("--no-intern", action="store_true",
+                   help="buffer every header as a plain string instead of interning the low-cardinality ones")
+    p.add_argument("--resume", action="store_true",
+                   help="continue after the last chunk recorded in <out>/manifest.json")
+    p.add_argument("--skip-titles", nargs="*", default=list(DEFAULT_SKIP_TITLES), metavar="TITLE",
+                   help="drop games where either player has one of these titles before parsing moves "
+                        "(default: BOT; pass the flag with no values to keep all)")
+    p.add_argument("--skip-terminations", nargs="*", default=list(DEFAULT_SKIP_TERMINATIONS),
+                   metavar="TERMINATION",
+                   help="drop games with one of these Termination headers before parsing moves "
+                        "(default: the ones clean.py drops; pass the flag with no values to keep all)")
+    p.add_argument("--where", action="append", default=[], metavar="EXPR",
+                   help='keep only games whose headers match, e.g. "GameType = Blitz", "WhiteElo >= 2000", '
+                        '"UTCDate < 2025.09.08"; repeat to AND (see module docstring)')
     p.add_argument("--verbose", action="store_true", help="enable verbose logging")
+    return p
+
+
+def stream_kwargs(args: argparse.Namespace) -> dict:
+    """stream_to_parquet keyword arguments for parsed build_parser() options."""
+    return dict(
+        chunk_games=args.chunk_games,
+        sample_games=args.sample_games,
+        fast_scan=args.fast_scan,
+        workers=args.workers,
+        block_mb=args.block_mb,
+        queue_depth=args.queue_depth,
+        buffer_mb=args.buffer_mb,
+        output_mode=args.output_mode,
+        row_group_rows=args.row_group_size,
+        target_file_mb=args.target_file_mb,
+        schema=args.schema,
+        resume=args.resume,
+        skip_titles=args.skip_titles,
+        skip_terminations=args.skip_terminations,
+        where=args.where,
+        sample_rate=args.sample_rate,
+        flush_mb=args.flush_mb,
+        max_rss_mb=args.max_rss_mb,
+        metrics_path=args.metrics,
+        metrics_interval=args.metrics_interval,
+        index=args.index,
+        shard=parse_shard(args.shard) if args.shard else None,
+        extra_columns=args.extra_columns,
+        intern=not args.no_intern,
+        duckdb_path=args.duckdb_path,
+        duckdb_table=args.duckdb_table,
+        write_queue=args.write_queue,
+    )
+
+
+def main() -> None:
+    p = build_parser()
     args = p.parse_args()
+    many = len(args.zst_path) > 1 or glob.has_magic(args.zst_path[0])
 
     logging.basicConfig(
         level=logging.DEBUG if args.verbose else logging.INFO,
-        format="%(asctime)s %(levelname)s: %(message)s",
+        # several inputs log from one thread each, named after the partition
+        format="%(asctime)s %(levelname)s: [%(threadName)s] %(message)s" if many
+        else "%(asctime)s %(levelname)s: %(message)s",
     )
 
-    stream_to_parquet(
-        args.zst_path,
-        args.out,
-        chunk_games=args.chunk_games,
-        sample_games=args.sample_games,
-    )
+    if many:
+        if args.merge_shards or args.shard:
+            p.error("--shard / --merge-shards take a single input")
+        kwargs = stream_kwargs(args)
+        del kwargs["workers"]
+        stream_many(args.zst_path, args.out, args.workers, args.files_in_flight, **kwargs)
+        return
+
+    if args.merge_shards:
+        merge_shards(args.zst_path[0], args.out, args.merge_shards)
+        return
+
+    stream_to_parquet(args.zst_path[0], args.out, **stream_kwargs(args))
 
 
 if __name__ == "__main__":
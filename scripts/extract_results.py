@@ -6,6 +6,8 @@ import chess
 import pandas as pd
 import glob
 
+from extract_all import decode_move, in_sample
+
 # End reason mapping (authoritative codes)
 END_REASON_MAP = {
     0: "unknown",
@@ -29,7 +31,8 @@ def tokens_from_san_fast(san_str):
     return [ _trailer_strip.sub('', t) for t in toks if t]
 
 # single-game analyzer (returns detection booleans) --
-def analyze_single_game_row(moves_san, termination, result):
+# moves_bin (extract_all.py --extra-columns moves_bin) is replayed with Board.push instead of parsing SAN
+def analyze_single_game_row(moves_san, termination, result, moves_bin=None):
     if termination != 'Normal' or result != '1/2-1/2':
         return {
             "is_stalemate": False,
@@ -41,7 +44,10 @@ def analyze_single_game_row(moves_san, termination, result):
     
     
     board = chess.Board()
-    toks = tokens_from_san_fast(moves_san)
+    if moves_bin is not None:
+        toks, push = [decode_move(int(code)) for code in moves_bin], board.push
+    else:
+        toks, push = tokens_from_san_fast(moves_san), board.push_san
     seen = {board._transposition_key(): 1}
 
     is_stalemate = False
@@ -49,11 +55,11 @@ def analyze_single_game_row(moves_san, termination, result):
     is_fifty_move = False
     is_insufficient_material = False
 
-    for san in toks:
-        if not san:
+    for tok in toks:
+        if not tok:
             continue
         try:
-            board.push_san(san)
+            push(tok)
         except Exception:
             break
 
@@ -131,8 +137,9 @@ def process_row(row, row_index = None):
     termination = row.get("termination")
     result = row.get("result")
     mated = row.get("mated")
+    moves_bin = row.get("moves_bin")
     
-    dets = analyze_single_game_row(moves_san, termination, result)
+    dets = analyze_single_game_row(moves_san, termination, result, moves_bin)
     
     code = pick_end_reason_code(dets, termination, result, mated)
     
@@ -145,13 +152,15 @@ def process_row(row, row_index = None):
     }
 
 
-def stream_parquet_to_parquet(input_glob, out_dir, sample_games=None):
+def stream_parquet_to_parquet(input_glob, out_dir, sample_games=None, sample_rate=None):
     """
     Reads all Parquet files matching input_glob and writes a corresponding output file
     (1:1 mapping) into out_dir.
 
     Each output parquet will have only the desired processed data
     derived from each input file.
+
+    sample_rate keeps the same hash-selected games as extract_all.py --sample-rate.
     """
     os.makedirs(out_dir, exist_ok=True)
 
@@ -167,6 +176,8 @@ def stream_parquet_to_parquet(input_glob, out_dir, sample_games=None):
         df = pd.read_parquet(parquet_path)
 
         # optional sampling for testing
+        if sample_rate is not None:
+            df = df[df["game_id"].map(lambda gid: in_sample(gid, sample_rate))]
         if sample_games:
             df = df.iloc[:sample_games]
 
@@ -188,5 +199,6 @@ if __name__ == "__main__":
     p.add_argument("--parquet_path", default = "out/cleaned_games/*.parquet", help="path to the input Parquet folder")
     p.add_argument("--out", default=r"out\terminations", help="output directory for parquet chunks")
     p.add_argument("--sample-games", type=int, default=None, help="if set, stop after this many games (for quick test)")
+    p.add_argument("--sample-rate", type=float, default=None, help="keep the same hash-selected share of games as extract_all.py --sample-rate")
     args = p.parse_args()
-    stream_parquet_to_parquet(args.parquet_path, args.out, args.sample_games)
+    stream_parquet_to_parquet(args.parquet_path, args.out, args.sample_games, args.sample_rate)
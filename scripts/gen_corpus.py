@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# gen_corpus.py
+"""
+Write a deterministic synthetic Lichess-style .pgn.zst for benchmarks and quick tests.
+
+Games have the Lichess header set and order, and their movetext is a legal random playout
+rendered the way the Lichess dumps write it (one line, "1... " after comments, result token).
+The same --seed and options always produce the same bytes, whatever --workers is.
+Random playouts cost a few ms per game in python-chess; use --workers for large corpora.
+
+Usage example:
+python scripts\\gen_corpus.py out/bench/corpus_100k.pgn.zst --games 100000 --seed 1
+
+Knobs:
+  --mix         game-type weights, e.g. "bullet=3,blitz=5,rapid=2,classical=0.5,correspondence=0.1"
+  --plies       min,max half-moves per game (playouts stop early at mate/stalemate/draw)
+  --bot-rate    share of games with a BOT player (skipped by extract_all / clean.py)
+  --clock-rate  share of timed games carrying [%clk] comments
+  --eval-rate   share of games carrying [%eval] comments (as analysed Lichess games do)
+  --terminations weights for Normal / Time forfeit / Abandoned / Rules infraction / Unterminated
+  --frame-games start a new zstd frame every N games (multi-frame files, like pzstd output)
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import logging
+import random
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import chess
+import zstandard as zstd
+
+DEFAULT_GAMES = 10_000
+DEFAULT_SEED = 1
+DEFAULT_MIX = "ultrabullet=0.2,bullet=3,blitz=5,rapid=2,classical=0.5,correspondence=0.1"
+DEFAULT_PLIES = (0, 160)
+DEFAULT_BOT_RATE = 0.03
+DEFAULT_CLOCK_RATE = 0.9
+DEFAULT_EVAL_RATE = 0.1
+DEFAULT_TERMINATIONS = "normal=60,time_forfeit=35,abandoned=2,rules_infraction=1,unterminated=0.5"
+DEFAULT_LEVEL = 3
+
+# Event word and typical time controls (initial, increment) per game type
+GAME_TYPES = {
+    "ultrabullet": ("UltraBullet", [(15, 0), (30, 0)]),
+    "bullet": ("Bullet", [(60, 0), (120, 1), (30, 0)]),
+    "blitz": ("Blitz", [(180, 0), (180, 2), (300, 0), (300, 3)]),
+    "rapid": ("Rapid", [(600, 0), (600, 5), (900, 10)]),
+    "classical": ("Classical", [(1800, 0), (1800, 20)]),
+    "correspondence": ("Correspondence", [None]),
+}
+
+TERMINATIONS = {
+    "normal": "Normal",
+    "time_forfeit": "Time forfeit",
+    "abandoned": "Abandoned",
+    "rules_infraction": "Rules infraction",
+    "unterminated": "Unterminated",
+}
+
+OPENINGS = [
+    ("B01", "Scandinavian Defense"),
+    ("C20", "King's Pawn Game"),
+    ("C50", "Italian Game"),
+    ("B20", "Sicilian Defense"),
+    ("D00", "Queen's Pawn Game"),
+    ("A00", "Van't Kruijs Opening"),
+    ("C00", "French Defense"),
+    ("B10", "Caro-Kann Defense"),
+    ("A40", "Englund Gambit"),
+    ("C44", "Scotch Game"),
+]
+
+TITLES = ["GM", "IM", "FM", "CM", "NM", "WGM", "LM"]
+
+_SITE_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+logger = logging.getLogger(__name__)
+
+
+def parse_weights(spec: str, choices) -> dict[str, float]:
+    """ "a=1,b=2.5" -> {"a": 1.0, "b": 2.5}; names must be in choices."""
+    weights = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        name = name.strip().lower()
+        if name not in choices:
+            raise ValueError(f"unknown name {name!r} in {spec!r}; expected one of {sorted(choices)}")
+        weights[name] = float(value)
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError(f"weights {spec!r} must include a positive value")
+    return weights
+
+
+def _clock(seconds: float) -> str:
+    s = max(0, int(seconds))
+    return f"{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+
+def _eval(rng: random.Random, board: chess.Board) -> str:
+    if rng.random() < 0.03:
+        return f"#{rng.choice([-1, 1]) * rng.randint(1, 12)}"
+    return f"{rng.gauss(0, 2.0):.2f}"
+
+
+def _movetext(rng: random.Random, plies: int, timecontrol, clocks: bool, evals: bool) -> tuple[str, chess.Board]:
+    board = chess.Board()
+    parts: list[str] = []
+    clock = [float(timecontrol[0]), float(timecontrol[0])] if clocks else None
+    for ply in range(plies):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        # light playout bias: now and then take a mate in one, otherwise uniform
+        move = rng.choice(moves)
+        if ply >= 20 and rng.random() < 0.05:
+            for m in moves:
+                if board.gives_check(m):
+                    board.push(m)
+                    mate = board.is_checkmate()
+                    board.pop()
+                    if mate:
+                        move = m
+                        break
+        san = board.san_and_push(move)
+        white = ply % 2 == 0
+        number = ply // 2 + 1
+        comments = []
+        if evals:
+            comments.append(f"[%eval {_eval(rng, board)}]")
+        if clock is not None:
+            side = 0 if white else 1
+            clock[side] = max(0.0, clock[side] - rng.expovariate(1 / max(1.0, timecontrol[0] / 60)) + timecontrol[1])
+            comments.append(f"[%clk {_clock(clock[side])}]")
+        if white:
+            parts.append(f"{number}. {san}")
+        elif not parts or parts[-1].endswith("}"):
+            parts.append(f"{number}... {san}")
+        else:
+            parts.append(san)
+        if comments:
+            parts.append("{ " + " ".join(comments) + " }")
+        if board.is_game_over(claim_draw=False):
+            break
+    return " ".join(parts), board
+
+
+def make_game(index: int, seed: int, games: int, types: tuple[list[str], list[float]],
+              terms: tuple[list[str], list[float]], plies: tuple[int, int], bot_rate: float,
+              clock_rate: float, eval_rate: float, start: dt.datetime) -> str:
+    """
+    Game number `index` of the corpus (headers, blank line, movetext, blank line).
+
+    Every game has its own generator seeded from (seed, index), so games can be made in any
+    order or in parallel and the corpus is still the same.
+    """
+    rng = random.Random(f"{seed}:{index}")
+    when = start + dt.timedelta(seconds=2 * index + rng.randint(0, 1))
+    event, controls = GAME_TYPES[rng.choices(*types)[0]]
+    timecontrol = rng.choice(controls)
+    termination = TERMINATIONS[rng.choices(*terms)[0]]
+    n_plies = 0 if termination == "Abandoned" else rng.randint(*plies)
+    clocks = timecontrol is not None and rng.random() < clock_rate
+    evals = rng.random() < eval_rate
+    movetext, board = _movetext(rng, n_plies, timecontrol, clocks, evals)
+
+    outcome = board.outcome(claim_draw=False)
+    if termination == "Unterminated":
+        result = "*"
+    elif outcome is not None:
+        result = outcome.result()
+        termination = "Normal"
+    elif termination == "Time forfeit":
+        result = rng.choice(["1-0", "0-1", "1-0", "0-1", "1/2-1/2"])
+    else:
+        result = rng.choice(["1-0", "0-1", "1/2-1/2"])
+
+    white_elo, black_elo = (int(rng.gauss(1600, 350)) for _ in range(2))
+    eco, opening = rng.choice(OPENINGS)
+    site = "".join(rng.choices(_SITE_ALPHABET, k=8))
+    headers = [
+        ("Event", f"Rated {event} game"),
+        ("Site", f"https://lichess.org/{site}"),
+        ("Date", when.strftime("%Y.%m.%d")),
+        ("Round", "-"),
+        ("White", f"player{rng.randint(0, games // 4 + 10)}"),
+        ("Black", f"player{rng.randint(0, games // 4 + 10)}"),
+        ("Result", result),
+        ("UTCDate", when.strftime("%Y.%m.%d")),
+        ("UTCTime", when.strftime("%H:%M:%S")),
+        ("WhiteElo", str(max(400, white_elo))),
+        ("BlackElo", str(max(400, black_elo))),
+        ("WhiteRatingDiff", f"{rng.randint(-12, 12):+d}"),
+        ("BlackRatingDiff", f"{rng.randint(-12, 12):+d}"),
+    ]
+    for side in ("White", "Black"):
+        r = rng.random()
+        if r < bot_rate:
+            headers.append((f"{side}Title", "BOT"))
+        elif r < bot_rate + 0.01:
+            headers.append((f"{side}Title", rng.choice(TITLES)))
+    headers += [
+        ("ECO", eco),
+        ("Opening", opening),
+        ("TimeControl", "-" if timecontrol is None else f"{timecontrol[0]}+{timecontrol[1]}"),
+        ("Termination", termination),
+    ]
+    tags = "".join(f'[{k} "{v}"]\n' for k, v in headers)
+    return f"{tags}\n{movetext} {result}\n\n" if movetext else f"{tags}\n{result}\n\n"
+
+
+def generate_games(
+    games: int = DEFAULT_GAMES,
+    seed: int = DEFAULT_SEED,
+    mix: str = DEFAULT_MIX,
+    plies: tuple[int, int] = DEFAULT_PLIES,
+    bot_rate: float = DEFAULT_BOT_RATE,
+    clock_rate: float = DEFAULT_CLOCK_RATE,
+    eval_rate: float = DEFAULT_EVAL_RATE,
+    terminations: str = DEFAULT_TERMINATIONS,
+    start: dt.datetime = dt.datetime(2025, 9, 1),
+    workers: int = 1,
+) -> Iterator[str]:
+    """Yield `games` PGN game strings in order; workers > 1 builds them in a process pool."""
+    type_w = parse_weights(mix, GAME_TYPES)
+    term_w = parse_weights(terminations, TERMINATIONS)
+    make = partial(make_game, seed=seed, games=games, types=(list(type_w), list(type_w.values())),
+                   terms=(list(term_w), list(term_w.values())), plies=plies, bot_rate=bot_rate,
+                   clock_rate=clock_rate, eval_rate=eval_rate, start=start)
+    if workers <= 1:
+        yield from map(make, range(games))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(make, range(games), chunksize=256)
+
+
+def write_corpus(path: str | Path, games: int = DEFAULT_GAMES, seed: int = DEFAULT_SEED,
+                 frame_games: int | None = None, level: int = DEFAULT_LEVEL, **options) -> Path:
+    """
+    Write generate_games(games, seed, **options) to path as zstd.
+
+    frame_games: if set, every N games start a new zstd frame (otherwise one streamed frame).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cctx = zstd.ZstdCompressor(level=level)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as fh:
+        if frame_games:
+            batch: list[str] = []
+            for i, game in enumerate(generate_games(games, seed, **options), 1):
+                batch.append(game)
+                if i % frame_games == 0:
+                    fh.write(cctx.compress("".join(batch).encode("utf-8")))
+                    batch.clear()
+            if batch:
+                fh.write(cctx.compress("".join(batch).encode("utf-8")))
+        else:
+            with cctx.stream_writer(fh, closefd=False) as w:
+                for game in generate_games(games, seed, **options):
+                    w.write(game.encode("utf-8"))
+    tmp.replace(path)
+    return path
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Write a deterministic synthetic Lichess .pgn.zst")
+    p.add_argument("out", help="output .pgn.zst path")
+    p.add_argument("--games", type=int, default=DEFAULT_GAMES, help="number of games (default 10000)")
+    p.add_argument("--seed", type=int, default=DEFAULT_SEED, help="random seed (default 1)")
+    p.add_argument("--mix", default=DEFAULT_MIX, help=f"game-type weights (default {DEFAULT_MIX})")
+    p.add_argument("--plies", default=f"{DEFAULT_PLIES[0]},{DEFAULT_PLIES[1]}",
+                   help="min,max half-moves per game (default 0,160)")
+    p.add_argument("--bot-rate", type=float, default=DEFAULT_BOT_RATE, help="share of games with a BOT player")
+    p.add_argument("--clock-rate", type=float, default=DEFAULT_CLOCK_RATE, help="share of timed games with [%%clk]")
+    p.add_argument("--eval-rate", type=float, default=DEFAULT_EVAL_RATE, help="share of games with [%%eval]")
+    p.add_argument("--terminations", default=DEFAULT_TERMINATIONS,
+                   help=f"termination weights (default {DEFAULT_TERMINATIONS})")
+    p.add_argument("--frame-games", type=int, default=None, help="start a new zstd frame every N games")
+    p.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="zstd level (default 3)")
+    p.add_argument("--workers", type=int, default=1, help="generate games in N processes (same output)")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    lo, _, hi = args.plies.partition(",")
+    path = write_corpus(args.out, args.games, args.seed, frame_games=args.frame_games, level=args.level,
+                        mix=args.mix, plies=(int(lo), int(hi or lo)), bot_rate=args.bot_rate,
+                        clock_rate=args.clock_rate, eval_rate=args.eval_rate, terminations=args.terminations,
+                        workers=args.workers)
+    logger.info("Wrote %d games to %s (%.1f MB)", args.games, path, path.stat().st_size / 2**20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# lookup_game.py
+"""
+Print the original PGN of games by game_id using the index written by extract_all.py --index.
+
+Usage example:
+python scripts\lookup_game.py in\lichess_db_standard_rated_2025-09.pgn.zst out/raw_games/game_index.parquet a1B2c3D4 e5F6g7H8
+
+Only the zstd frame holding each game is decompressed. Lichess dumps are one frame, so first
+rewrite the dump as small frames once and index that copy:
+python scripts\lookup_game.py --reframe in\lichess_db_standard_rated_2025-09.pgn.zst in\2025-09.framed.pgn.zst
+python scripts\extract_all.py in\2025-09.framed.pgn.zst --out out/raw_games --index
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+
+from extract_all import GameIndex, reframe
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Fetch raw PGN for game ids via game_index.parquet")
+    p.add_argument("zst_path", help="the .pgn.zst the index was built from")
+    p.add_argument("index_or_dst", help="game_index.parquet (or, with --reframe, the output .pgn.zst)")
+    p.add_argument("game_ids", nargs="*", help="game ids to print")
+    p.add_argument("--reframe", action="store_true",
+                   help="rewrite zst_path as independent frames into index_or_dst instead of looking up")
+    p.add_argument("--frame-mb", type=int, default=16, help="decompressed MB per frame with --reframe (default 16)")
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    if args.reframe:
+        frames = reframe(args.zst_path, args.index_or_dst, args.frame_mb)
+        logger.info("Wrote %d frames to %s", frames, args.index_or_dst)
+        return
+
+    index = GameIndex(args.index_or_dst, args.zst_path)
+    missing = 0
+    for game_id in args.game_ids:
+        t0 = time.perf_counter()
+        raw = index.raw_game(game_id)
+        if raw is None:
+            logger.warning("%s is not in %s", game_id, args.index_or_dst)
+            missing += 1
+            continue
+        logger.info("%s: %.1f ms", game_id, (time.perf_counter() - t0) * 1000)
+        sys.stdout.write(raw)
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
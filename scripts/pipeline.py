@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# pipeline.py
+"""
+Fused extract -> clean -> end reason: one pass over a .pgn.zst that writes the final dataset
+(clean.py's cleaned_games columns, white_id/black_id, and extract_results.py's end_code /
+end_reason) without writing and re-reading out/raw_games and out/cleaned_games.
+
+Every chunk that extract_all.stream_to_parquet flushes goes through CleanAndClassify in memory:
+clean.py's SQL runs in DuckDB directly over the Arrow batch (players dimension included), then
+extract_results.process_row classifies each game, and only the result is written. Chunk
+boundaries, the manifest, --resume, --workers, --fast-scan, --where, --extra-columns etc. are
+those of extract_all.py; --keep-raw / --keep-cleaned also write the intermediates for debugging.
+
+Usage example:
+python scripts\\pipeline.py in\\lichess_db_standard_rated_2025-09.pgn.zst --out out/games --fast-scan --workers 4
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import clean
+from extract_all import FNAME_PAD, MANIFEST_NAME, build_parser, compression, stream_kwargs, stream_to_parquet
+from extract_results import process_row
+
+DEFAULT_OUT = "out/games"
+DEFAULT_DUCKDB_TABLE = "games"  # not extract_all.py's raw_games: these rows are already cleaned
+# columns process_row reads (moves_bin only if the games have it)
+END_REASON_INPUTS = ("game_id", "moves_san", "termination", "result", "mated", "moves_bin")
+
+logger = logging.getLogger(__name__)
+
+
+class CleanAndClassify:
+    """
+    stream_to_parquet transform: raw (or typed) chunk -> cleaned games with player ids and end reason.
+
+    The players table lives in this object's DuckDB connection and is saved to players_file after
+    every chunk, before the chunk itself is written, so a resumed run (which redoes at most the
+    chunk in flight) hands out the same ids. keep_raw / keep_cleaned: directories to also write
+    each chunk's intermediate tables to, numbered from `start` like the output chunks.
+    """
+
+    name = "clean+end_reason"
+
+    def __init__(self, players_file: str | Path = clean.PLAYERS_FILE, keep_raw: str | Path | None = None,
+                 keep_cleaned: str | Path | None = None, start: int = 0) -> None:
+        self.players_file = str(players_file)
+        self.keep_raw = Path(keep_raw) if keep_raw else None
+        self.keep_cleaned = Path(keep_cleaned) if keep_cleaned else None
+        for d in (self.keep_raw, self.keep_cleaned):
+            if d is not None:
+                d.mkdir(parents=True, exist_ok=True)
+        self.chunks = start
+        self.con = duckdb.connect()
+        clean.load_players(self.con, self.players_file)
+
+    def _keep(self, out_dir: Path | None, table: pa.Table) -> None:
+        if out_dir is not None:
+            pq.write_table(table, out_dir / f"chunk_{self.chunks:0{FNAME_PAD}d}.parquet", compression=compression)
+
+    def _save_players(self) -> None:
+        tmp = f"{self.players_file}.tmp"
+        self.con.execute(f"COPY (SELECT * FROM players ORDER BY id) TO '{tmp}' (FORMAT PARQUET, COMPRESSION 'snappy')")
+        os.replace(tmp, self.players_file)
+
+    def __call__(self, table: pa.Table) -> pa.Table:
+        self._keep(self.keep_raw, table)
+        self.con.register("raw_batch", table)
+        try:
+            clean.stage_chunk(self.con, "raw_batch")
+        finally:
+            self.con.unregister("raw_batch")
+        cleaned = pa.table(self.con.execute(clean.CLEANED_SQL).arrow())
+        self._save_players()
+        self._keep(self.keep_cleaned, cleaned)
+
+        inputs = [name for name in END_REASON_INPUTS if name in cleaned.column_names]
+        ends = [process_row(row) for row in cleaned.select(inputs).to_pylist()]
+        self.chunks += 1
+        return cleaned.append_column("end_code", pa.array([e["end_code"] for e in ends], pa.int64())) \
+                      .append_column("end_reason", pa.array([e["end_reason"] for e in ends], pa.string()))
+
+    def close(self) -> None:
+        count = self.con.execute("SELECT count(*) FROM players").fetchone()[0]
+        self.con.close()
+        logger.info("%d players in %s", count, self.players_file)
+
+
+def main() -> None:
+    p = build_parser()
+    p.description = "Stream .pgn.zst -> cleaned games with player ids and end reasons (extract + clean + results)"
+    p.set_defaults(out=DEFAULT_OUT, duckdb_table=DEFAULT_DUCKDB_TABLE)
+    p.add_argument("--players", default=clean.PLAYERS_FILE,
+                   help=f"players dimension to extend (default {clean.PLAYERS_FILE}, shared with clean.py)")
+    p.add_argument("--keep-raw", default=None, metavar="DIR", help="also write the extracted chunks here")
+    p.add_argument("--keep-cleaned", default=None, metavar="DIR",
+                   help="also write the cleaned chunks (before end reasons) here")
+    args = p.parse_args()
+    if len(args.zst_path) > 1:
+        p.error("takes a single input: months share the players table, which is filled in input order")
+    if args.shard or args.merge_shards:
+        p.error("--shard / --merge-shards are not supported: shards would assign player ids independently")
+    if args.output_mode == "stream":
+        p.error("--output-mode stream is not supported; use chunks or duckdb")
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s: %(message)s",
+    )
+
+    start = 0
+    manifest_path = Path(args.out) / MANIFEST_NAME
+    if args.resume and manifest_path.exists():
+        with open(manifest_path, encoding="utf-8") as f:
+            start = len(json.load(f)["chunks"])
+    transform = CleanAndClassify(args.players, args.keep_raw, args.keep_cleaned, start)
+    try:
+        stream_to_parquet(args.zst_path[0], args.out, transform=transform, **stream_kwargs(args))
+    finally:
+        transform.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+extract_all.py end to end on a small gen_corpus.py file: the fast scan, a resumed run and a
+sharded run must all write what one plain run writes.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from extract_all import INDEX_NAME, MANIFEST_NAME, SKIPPED_NAME, merge_shards, stream_to_parquet  # noqa: E402
+from gen_corpus import write_corpus  # noqa: E402
+
+GAMES = 300
+CHUNK_GAMES = 60
+FRAME_GAMES = 40  # several zstd frames, so resumed runs and shards seek to a frame
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory) -> Path:
+    return write_corpus(tmp_path_factory.mktemp("corpus") / "corpus.pgn.zst", games=GAMES, seed=7,
+                        frame_games=FRAME_GAMES)
+
+
+def _chunk_files(out_dir: Path) -> list[Path]:
+    return sorted(out_dir.glob("chunk_*.parquet"))
+
+
+def _rows(out_dir: Path) -> list[dict]:
+    return [row for path in _chunk_files(out_dir) for row in pq.read_table(path).to_pylist()]
+
+
+def _json(path: Path) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("extra_columns", [(), ("clocks", "evals")])
+def test_fast_scan_matches_full_parse(corpus, tmp_path, extra_columns):
+    full, fast = tmp_path / "full", tmp_path / "fast"
+    stream_to_parquet(corpus, full, chunk_games=CHUNK_GAMES, extra_columns=extra_columns)
+    stream_to_parquet(corpus, fast, chunk_games=CHUNK_GAMES, extra_columns=extra_columns, fast_scan=True)
+    assert _rows(full)
+    assert _rows(fast) == _rows(full)
+    assert _json(fast / SKIPPED_NAME) == _json(full / SKIPPED_NAME)
+
+
+@pytest.mark.parametrize("fast_scan", [False, True])
+def test_resume_after_interrupted_run(corpus, tmp_path, fast_scan):
+    full, part = tmp_path / "full", tmp_path / "part"
+    stream_to_parquet(corpus, full, chunk_games=CHUNK_GAMES, fast_scan=fast_scan)
+    stream_to_parquet(corpus, part, chunk_games=CHUNK_GAMES, fast_scan=fast_scan)
+    # leave part/ as a run stopped right after its second chunk would
+    manifest = _json(part / MANIFEST_NAME)
+    assert len(manifest["chunks"]) > 2
+    for path in _chunk_files(part)[2:]:
+        path.unlink()
+    manifest["chunks"], manifest["complete"] = manifest["chunks"][:2], False
+    (part / MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+
+    stream_to_parquet(corpus, part, chunk_games=CHUNK_GAMES, fast_scan=fast_scan, resume=True)
+    assert [p.name for p in _chunk_files(part)] == [p.name for p in _chunk_files(full)]
+    assert _rows(part) == _rows(full)
+    assert _json(part / MANIFEST_NAME) == _json(full / MANIFEST_NAME)
+
+
+def test_resume_rejects_other_settings(corpus, tmp_path):
+    stream_to_parquet(corpus, tmp_path, chunk_games=CHUNK_GAMES, sample_games=100)
+    with pytest.raises(ValueError, match="settings"):
+        stream_to_parquet(corpus, tmp_path, chunk_games=CHUNK_GAMES, resume=True)
+
+
+@pytest.mark.parametrize("shards", [2, 3])
+def test_merged_shards_match_full_run(corpus, tmp_path, shards):
+    full, merged = tmp_path / "full", tmp_path / "merged"
+    stream_to_parquet(corpus, full, chunk_games=CHUNK_GAMES, index=True)
+    shard_dirs = [tmp_path / f"shard{i}" for i in range(shards)]
+    for i, shard_dir in enumerate(shard_dirs):
+        stream_to_parquet(corpus, shard_dir, chunk_games=CHUNK_GAMES, index=True, shard=(i, shards))
+    merge_shards(corpus, merged, shard_dirs)
+    assert _rows(merged) == _rows(full)
+    assert _json(merged / SKIPPED_NAME) == _json(full / SKIPPED_NAME)
+    assert pq.read_table(merged / INDEX_NAME).equals(pq.read_table(full / INDEX_NAME))